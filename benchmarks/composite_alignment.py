@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "script"))
+
+from composite import create_composite
+from scale_factors import FILL_VALUE
+
+SIZE = 300
+PIXEL_SIZE = 30
+ORIGIN = (300000, 2000000)
+
+# QA_PIXEL values of clear land and high-confidence cloud
+QA_CLEAR = 21824
+QA_CLOUD = 22280
+
+
+def write_scene(raw_data_folder, name, size, cloud_cover, cloud_rows=None):
+    """Write a scene of `size` x `size` pixels at ORIGIN, with its QA_PIXEL cloudy over `cloud_rows`."""
+    folder = os.path.join(raw_data_folder, name)
+    os.makedirs(folder)
+    profile = dict(driver='GTiff', width=size, height=size, count=1, dtype='uint16', crs='EPSG:32631',
+                   transform=from_origin(*ORIGIN, PIXEL_SIZE, PIXEL_SIZE))
+
+    for band in range(1, 8):
+        with rasterio.open(os.path.join(folder, f'{name}_SR_B{band}.TIF'), 'w', nodata=FILL_VALUE, **profile) as dst:
+            dst.write(np.full((1, size, size), 10000 + 1000 * band, dtype=np.uint16))
+
+    qa = np.full((size, size), QA_CLEAR, dtype=np.uint16)
+    if cloud_rows:
+        qa[slice(*cloud_rows)] = QA_CLOUD
+    with rasterio.open(os.path.join(folder, f'{name}_QA_PIXEL.TIF'), 'w', nodata=1, **profile) as dst:
+        dst.write(qa, 1)
+
+    with open(os.path.join(folder, f'{name}_MTL.json'), 'w') as mtl_file:
+        json.dump({"LANDSAT_METADATA_FILE": {"IMAGE_ATTRIBUTES": {"CLOUD_COVER": str(cloud_cover)}}}, mtl_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that composites of scenes on mismatched grids only leave "
+                                                 "fill where no scene has a clear observation.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary root folder")
+    args = parser.parse_args()
+
+    root_directory = tempfile.mkdtemp(prefix="reflectra_composite_")
+    raw_data_folder = os.path.join(root_directory, "raw_data")
+    # The clearest scene sets the grid and has a cloud strip; the second covers only a corner of
+    # the grid; the third is clear everywhere, so every pixel has a clear observation
+    write_scene(raw_data_folder, "SCENE_A", SIZE, 1, cloud_rows=(100, 150))
+    write_scene(raw_data_folder, "SCENE_B", SIZE // 3, 5)
+    write_scene(raw_data_folder, "SCENE_C", SIZE, 10)
+
+    failed = False
+    try:
+        for method in ('median', 'best-qa'):
+            with rasterio.open(create_composite(root_directory, method=method, max_workers=1)) as src:
+                fill_pixels = int((src.read() == FILL_VALUE).any(axis=0).sum())
+            print(f"{method:>8}: {fill_pixels} fill pixels")
+            failed = failed or fill_pixels > 0
+    finally:
+        if args.keep:
+            print(f"Kept {root_directory}")
+        else:
+            shutil.rmtree(root_directory)
+
+    if failed:
+        sys.exit("Composite left fill where a scene had a clear observation.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "script"))
+
+from download_data import download_scenes
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_handler(file_size, bandwidth, drop_first_requests):
+    """Build a request handler serving fake .tar files with Range support and a per-connection bandwidth cap."""
+    payload = bytes(range(256)) * (file_size // 256 + 1)
+    dropped = set()
+    lock = threading.Lock()
+
+    class MockDownloadHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            start = 0
+            match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                if start >= file_size:
+                    self.send_response(416)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+            self.send_response(206 if match else 200)
+            self.send_header("Content-Length", str(file_size - start))
+            self.end_headers()
+
+            # Simulate a dropped connection halfway through the first request of each file
+            with lock:
+                drop = drop_first_requests and self.path not in dropped
+                dropped.add(self.path)
+            end = start + (file_size - start) // 2 if drop else file_size
+
+            for offset in range(start, end, CHUNK_SIZE):
+                chunk = payload[offset:min(offset + CHUNK_SIZE, end)]
+                self.wfile.write(chunk)
+                time.sleep(len(chunk) / bandwidth)
+            if drop:
+                self.close_connection = True
+
+    return MockDownloadHandler
+
+
+def run_downloads(port, scene_count, max_workers):
+    """Download every fake scene into a fresh directory. Returns the wall time in seconds."""
+    output_directory = tempfile.mkdtemp(prefix="reflectra_download_")
+    jobs = [(f"SCENE_{index:03d}", lambda index=index: f"http://127.0.0.1:{port}/SCENE_{index:03d}.tar")
+            for index in range(scene_count)]
+    try:
+        start = time.perf_counter()
+        results = download_scenes(requests.Session(), jobs, output_directory, max_workers=max_workers,
+                                  retries=3, backoff=0.1)
+        seconds = time.perf_counter() - start
+        failed = [product_id for product_id, path in results.items() if path is None]
+        if failed:
+            print(f"Failed downloads: {failed}")
+        return seconds
+    finally:
+        shutil.rmtree(output_directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential and concurrent scene downloads "
+                                                 "against a local mock HTTP server.")
+    parser.add_argument("--scenes", type=int, default=16)
+    parser.add_argument("--size-mb", type=float, default=8)
+    parser.add_argument("--bandwidth-mb", type=float, default=16, help="Per-connection bandwidth cap (MB/s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--drop-first", action="store_true",
+                        help="Drop every file's first connection halfway to exercise retry and resume")
+    args = parser.parse_args()
+
+    file_size = int(args.size_mb * 1e6)
+    handler = make_handler(file_size, args.bandwidth_mb * 1e6, args.drop_first)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    total_mb = args.scenes * file_size / 1e6
+    baseline = None
+    try:
+        for max_workers in args.workers:
+            # Each run gets a fresh server state so dropped connections happen again
+            server.RequestHandlerClass = make_handler(file_size, args.bandwidth_mb * 1e6, args.drop_first)
+            seconds = run_downloads(server.server_address[1], args.scenes, max_workers)
+            baseline = baseline or seconds
+            print(f"{max_workers:>2} workers: {seconds:6.2f} s, {total_mb / seconds:7.1f} MB/s, "
+                  f"{baseline / seconds:4.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from synthetic_scenes import FULL_HEIGHT, FULL_WIDTH, make_scenes
+
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "script"))
+
+from band_cube import open_band_cube, read_cube_values
+from extract_data import extract_data
+from instrumentation import measure, write_metrics
+from metadata_catalog import ingest_metadata
+from pipeline import SCENE_STAGE_NAMES, run_pipeline
+from pixel_resolver import rowcol_to_latlon
+from stack_img import get_stack_output_path
+
+# Display width of the stacked image on the Pixel page
+PREVIEW_WIDTH = 600
+
+
+def link_scenes(cache_directory, root_directory, scene_names):
+    """Hard-link the cached synthetic scenes (folders or .tar bundles) into a fresh <root>/raw_data."""
+    raw_data_folder = os.path.join(root_directory, "raw_data")
+    os.makedirs(raw_data_folder)
+    for name in scene_names:
+        source = os.path.join(cache_directory, "raw_data", name)
+        if os.path.isdir(source):
+            os.makedirs(os.path.join(raw_data_folder, name))
+            for file_name in os.listdir(source):
+                link_file(os.path.join(source, file_name), os.path.join(raw_data_folder, name, file_name))
+        else:
+            link_file(f"{source}.tar", os.path.join(raw_data_folder, f"{name}.tar"))
+
+
+def link_file(source, destination):
+    """Hard-link a file, or copy it across file systems."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def query_pixel(root_directory, scene_name, x, y):
+    """One click on the Pixel page: the same reads as web/pages/Pixel.py for the selected pixel."""
+    stack_path = get_stack_output_path(root_directory, scene_name)
+    rowcol_to_latlon(stack_path, [y], [x])
+    with rasterio.open(stack_path) as src:
+        src.read([1, 2, 3], window=Window(x - 1, y - 1, 3, 3), boundless=True, fill_value=0)
+
+    cube = open_band_cube(os.path.join(root_directory, "raw_data", scene_name), scene_name)
+    return read_cube_values(cube, x, y) if cube is not None else None
+
+
+def load_preview(root_directory, scene_name):
+    """Loading the Pixel page: read the stacked image at display size, from its internal overviews."""
+    with rasterio.open(get_stack_output_path(root_directory, scene_name)) as src:
+        ratio = min(PREVIEW_WIDTH / src.width, 0.5)
+        return src.read([1, 2, 3], out_shape=(3, int(src.height * ratio), int(src.width * ratio)))
+
+
+def benchmark_pixel_page(root_directory, scene_names, width, height, queries):
+    """Time page loads and pixel queries. Returns (preview latencies, cold query latencies, warm query latencies)."""
+    rng = np.random.default_rng(0)
+    preview_seconds, cold_seconds, warm_seconds = [], [], []
+
+    for query in range(queries):
+        scene_name = scene_names[query % len(scene_names)]
+        x, y = int(rng.integers(1, width - 1)), int(rng.integers(1, height - 1))
+
+        # The first query of a scene opens its cube, later ones are served from the open memory map
+        first_query = query < len(scene_names)
+        if first_query:
+            start = time.perf_counter()
+            load_preview(root_directory, scene_name)
+            preview_seconds.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        query_pixel(root_directory, scene_name, x, y)
+        (cold_seconds if first_query else warm_seconds).append(time.perf_counter() - start)
+
+    return preview_seconds, cold_seconds, warm_seconds
+
+
+def format_latencies(label, seconds):
+    """Median and 95th percentile of a list of latencies, in ms."""
+    if not seconds:
+        return f"{label:<28} -"
+    return (f"{label:<28} median {statistics.median(seconds) * 1000:8.2f} ms  "
+            f"p95 {np.percentile(seconds, 95) * 1000:8.2f} ms  ({len(seconds)} queries)")
+
+
+def print_stage_table(records, scene_count):
+    """Print wall, CPU, peak RSS and I/O per stage, in pipeline order."""
+    print(f"{'stage':<18} {'runs':>5} {'fail':>5} {'wall s':>9} {'per scene':>10} {'cpu s':>9} "
+          f"{'peak RSS MB':>12} {'read MB':>9} {'write MB':>9}")
+    for stage in ['extract', *SCENE_STAGE_NAMES, 'catalog']:
+        stage_records = [record for record in records if record['stage'] == stage]
+        if not stage_records:
+            continue
+
+        def total(field):
+            return sum(record[field] or 0 for record in stage_records)
+
+        wall_seconds = total('wall_seconds')
+        peak_rss = max(record['peak_rss_bytes'] or 0 for record in stage_records)
+        print(f"{stage:<18} {len(stage_records):>5} {sum(1 for record in stage_records if record['error']):>5} "
+              f"{wall_seconds:>9.2f} {wall_seconds / scene_count * 1000:>8.1f}ms {total('cpu_seconds'):>9.2f} "
+              f"{peak_rss / 1e6:>12.1f} {total('rchar') / 1e6:>9.1f} {total('wchar') / 1e6:>9.1f}")
+
+
+def run_benchmark(cache_directory, scene_names, args):
+    """Run the pipeline end to end on the given cached scenes in a fresh root. Returns the stage records."""
+    root_directory = tempfile.mkdtemp(prefix=f"reflectra_e2e_{len(scene_names)}_")
+    link_scenes(cache_directory, root_directory, scene_names)
+    # Fetch and visualise the centre pixel, which is inside every scene's footprint
+    stage_args = argparse.Namespace(pixel_x=args.width // 2, pixel_y=args.height // 2)
+    records = []
+
+    # Stage output is only shown with --verbose; failures are counted in the table either way
+    output = open(os.devnull, "w") if not args.verbose else sys.stdout
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            if args.extract:
+                extract_data(root_directory, max_workers=args.workers, metrics=records)
+
+            run_pipeline(root_directory, args.stages, args=stage_args, force=True, max_workers=args.workers,
+                         metrics=records)
+
+            with measure('catalog') as record:
+                ingest_metadata(root_directory)
+            records.append(record)
+        total_seconds = time.perf_counter() - start
+
+        print(f"\n{len(scene_names)} scenes, {args.workers} workers: {total_seconds:.2f} s end to end")
+        print_stage_table(records, len(scene_names))
+
+        if 'stack' in args.stages:
+            preview_seconds, cold_seconds, warm_seconds = benchmark_pixel_page(
+                root_directory, scene_names, args.width, args.height, max(args.queries, len(scene_names)))
+            print(format_latencies("Pixel page load", preview_seconds))
+            print(format_latencies("Pixel query (cube cold)", cold_seconds))
+            print(format_latencies("Pixel query (cube warm)", warm_seconds))
+
+        if args.metrics_dir:
+            with contextlib.redirect_stdout(output):
+                write_metrics(os.path.join(args.metrics_dir, f"{len(scene_names)}_scenes"), records)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if args.keep:
+            print(f"Kept {root_directory}")
+        else:
+            shutil.rmtree(root_directory)
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage and the Pixel page query path "
+                                                 "end to end on synthetic Landsat scenes, offline.")
+    parser.add_argument("--scenes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--width", type=int, default=FULL_WIDTH,
+                        help="Scene width in pixels (default: full size, about 535 MB of GeoTIFFs per scene)")
+    parser.add_argument("--height", type=int, default=FULL_HEIGHT)
+    parser.add_argument("--tar", action="store_true",
+                        help="Generate .tar bundles only, read through /vsitar/ unless --extract is given")
+    parser.add_argument("--extract", action="store_true", help="Benchmark the extract stage first (implies --tar)")
+    parser.add_argument("--stages", nargs="+", default=SCENE_STAGE_NAMES, choices=SCENE_STAGE_NAMES)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=200, help="Pixel queries per scene count")
+    parser.add_argument("--cache-dir", help="Where the synthetic scenes are generated and reused across runs "
+                                            "(default: a temporary folder removed at the end)")
+    parser.add_argument("--metrics-dir", help="Also write each run's metrics log and Prometheus textfile here")
+    parser.add_argument("--keep", action="store_true", help="Keep each run's root folder")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the stages")
+    args = parser.parse_args()
+    args.tar = args.tar or args.extract
+
+    cache_directory = args.cache_dir or tempfile.mkdtemp(prefix="reflectra_synthetic_")
+    try:
+        # The largest run's scenes are generated once; smaller runs use the first of them
+        scene_names = make_scenes(cache_directory, max(args.scenes), args.width, args.height, archive=args.tar,
+                                  max_workers=args.workers)
+        for scene_count in args.scenes:
+            run_benchmark(cache_directory, scene_names[:scene_count], args)
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_directory)
+
+
+if __name__ == "__main__":
+    main()
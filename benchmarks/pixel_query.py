@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import rasterio
+
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "script"))
+
+from fetch_reflectance import read_pixel_dn
+
+
+def read_full_band(band_path, x, y):
+    """Previous query path: decode the whole band and index a single DN."""
+    with rasterio.open(band_path) as src:
+        return src.read(1)[y, x]
+
+
+def read_windowed(band_path, x, y):
+    """Current query path: decode only the block containing (x, y)."""
+    with rasterio.open(band_path) as src:
+        return read_pixel_dn(src, x, y)
+
+
+def measure(read_function, band_path, x, y, repeats):
+    """Return the median latency (s) and peak traced memory (bytes) of a query path."""
+    timings = []
+    peak = 0
+    for _ in range(repeats):
+        tracemalloc.start()
+        start = time.perf_counter()
+        value = read_function(band_path, x, y)
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    timings.sort()
+    return timings[len(timings) // 2], peak, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-band and windowed single-pixel reads.")
+    parser.add_argument("band_path", help="Path to a Landsat band GeoTIFF, e.g. *_SR_B4.TIF")
+    parser.add_argument("--x", type=int, default=3000)
+    parser.add_argument("--y", type=int, default=3000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for label, read_function in (("full band", read_full_band), ("windowed", read_windowed)):
+        latency, peak, value = measure(read_function, args.band_path, args.x, args.y, args.repeats)
+        results[label] = (latency, peak)
+        print(f"{label:>10}: DN={value}  median {latency * 1000:.2f} ms  peak {peak / 1e6:.2f} MB")
+
+    full_latency, full_peak = results["full band"]
+    window_latency, window_peak = results["windowed"]
+    print(f"Speed-up: {full_latency / window_latency:.1f}x, "
+          f"memory reduction: {full_peak / max(window_peak, 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "script")
+
+# Pipeline modules whose import time is measured; importing them must not run any stage
+MODULES = [
+    "main_run", "process_data", "stack_img", "fetch_reflectance", "visualise_data", "visualise_img_attributes",
+    "create_downloadable", "extract_data", "band_cube", "composite", "metadata_catalog", "scene_registry",
+    "tile_pyramid", "download_data",
+]
+
+
+def time_command(command, cwd, repeats):
+    """Run a command `repeats` times in a fresh interpreter. Returns the median wall time in seconds."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of every pipeline module and the "
+                                                 "startup time of a single-stage main_run invocation.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    args = parser.parse_args()
+
+    # Run from an empty <root>/script folder, so a module that still runs its stage at import finds no data
+    root_directory = tempfile.mkdtemp(prefix="reflectra_startup_")
+    working_directory = os.path.join(root_directory, "script")
+    os.makedirs(os.path.join(root_directory, "raw_data"))
+    os.makedirs(working_directory)
+
+    baseline = time_command([sys.executable, "-c", "pass"], working_directory, args.repeats)
+    print(f"{'python -c pass':<40} {baseline:6.3f} s")
+
+    for module in args.modules:
+        command = [sys.executable, "-c", f"import sys; sys.path.insert(0, {SCRIPT_DIRECTORY!r}); import {module}"]
+        print(f"{'import ' + module:<40} {time_command(command, working_directory, args.repeats):6.3f} s")
+
+    # A complete single-stage run on an empty raw_data folder
+    command = [sys.executable, os.path.join(SCRIPT_DIRECTORY, "main_run.py"), "process"]
+    print(f"{'main_run.py process':<40} {time_command(command, working_directory, args.repeats):6.3f} s")
+
+
+if __name__ == "__main__":
+    main()
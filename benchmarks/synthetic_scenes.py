@@ -0,0 +1,302 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from pyproj import Transformer
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# Size of a Landsat 8/9 Collection 2 Level-2 scene, in 30 m pixels
+FULL_WIDTH = 7761
+FULL_HEIGHT = 7871
+PIXEL_SIZE = 30
+
+# Scenes are centred on the default location of main_run, on WRS-2 path 92 row 86. Collection 2 uses
+# the northern UTM zone (negative northings) for southern-hemisphere scenes.
+CENTER_LATITUDE = -38.1477
+CENTER_LONGITUDE = 145.3764
+EPSG = 32655
+WRS_PATH = 92
+WRS_ROW = 86
+
+# One acquisition per 16-day revisit from this date
+FIRST_ACQUISITION = datetime.date(2020, 1, 5)
+REVISIT_DAYS = 16
+
+# Block size of the tiled GeoTIFFs, as in the USGS Cloud-Optimized GeoTIFFs
+BLOCK_SIZE = 256
+
+# Side of the cells of the synthetic land cover and cloud fields, in pixels
+CELL_SIZE = 64
+
+# Scene footprint inside the product grid: a rectangle rotated like a descending Landsat pass
+FOOTPRINT_ANGLE = np.radians(12)
+FOOTPRINT_EXTENT = 0.42
+
+# (band, reflectance of dark land, reflectance gain with the land field) of the SR bands
+SR_BANDS = [('SR_B1', 0.03, 0.05), ('SR_B2', 0.04, 0.06), ('SR_B3', 0.06, 0.08), ('SR_B4', 0.05, 0.12),
+            ('SR_B5', 0.15, 0.25), ('SR_B6', 0.10, 0.20), ('SR_B7', 0.06, 0.15)]
+CLOUD_REFLECTANCE = 0.6
+SR_MULT, SR_ADD = 2.75e-05, -0.2
+ST_MULT, ST_ADD = 0.00341802, 149.0
+
+# QA_PIXEL values of Landsat 8/9: fill, clear land and high-confidence cloud
+QA_FILL = 1
+QA_CLEAR = 21824
+QA_CLOUD = 22280
+
+BAND_NAMES = [band for band, _, _ in SR_BANDS] + ['ST_B10', 'QA_PIXEL']
+
+
+def get_scene_name(index):
+    """Return the Collection 2 Level-2 product ID of the index-th synthetic scene."""
+    acquired = FIRST_ACQUISITION + datetime.timedelta(days=REVISIT_DAYS * index)
+    processed = acquired + datetime.timedelta(days=10)
+    return f"LC08_L2SP_{WRS_PATH:03d}{WRS_ROW:03d}_{acquired:%Y%m%d}_{processed:%Y%m%d}_02_T1"
+
+
+def get_grid(width, height):
+    """Return the (transform, corner lat/lon dict) of a width x height scene centred on CENTER_LATITUDE/LONGITUDE."""
+    to_utm = Transformer.from_crs("EPSG:4326", f"EPSG:{EPSG}", always_xy=True)
+    center_x, center_y = to_utm.transform(CENTER_LONGITUDE, CENTER_LATITUDE)
+
+    # Landsat grid edges fall on odd multiples of 15 m
+    left = np.floor((center_x - width * PIXEL_SIZE / 2) / PIXEL_SIZE) * PIXEL_SIZE + 15
+    top = np.floor((center_y + height * PIXEL_SIZE / 2) / PIXEL_SIZE) * PIXEL_SIZE + 15
+    right, bottom = left + width * PIXEL_SIZE, top - height * PIXEL_SIZE
+
+    to_latlon = Transformer.from_crs(f"EPSG:{EPSG}", "EPSG:4326", always_xy=True)
+    corners = {}
+    for corner, x, y in (('UL', left, top), ('UR', right, top), ('LL', left, bottom), ('LR', right, bottom)):
+        corners[corner] = to_latlon.transform(x, y)
+    return from_origin(left, top, PIXEL_SIZE, PIXEL_SIZE), corners
+
+
+def make_fields(width, height, index):
+    """Return the coarse land field, the same for every scene, and the scene's cloud mask.
+
+    Both have one cell per CELL_SIZE x CELL_SIZE pixels.
+    """
+    shape = (-(-height // CELL_SIZE), -(-width // CELL_SIZE))
+
+    land = np.random.default_rng(0).random(shape)
+    rng = np.random.default_rng(index + 1)
+    clouds = rng.random(shape)
+    # Box blur, so clouds form connected banks rather than single cells
+    for axis in (0, 1):
+        clouds = sum(np.roll(clouds, shift, axis=axis) for shift in range(-3, 4)) / 7
+    cloud_cover = rng.choice([0, 0, 5, 10, 20, 40, 70])
+    cloud = clouds > np.quantile(clouds, 1 - cloud_cover / 100) if cloud_cover else np.zeros(shape, dtype=bool)
+    return land.astype(np.float32), cloud
+
+
+def get_footprint_mask(width, height, row_start, row_count):
+    """Return the mask of the rows of the scene inside the rotated footprint."""
+    rows = np.arange(row_start, row_start + row_count, dtype=np.float32)[:, np.newaxis] - height / 2
+    cols = np.arange(width, dtype=np.float32)[np.newaxis, :] - width / 2
+    along = cols * np.cos(FOOTPRINT_ANGLE) + rows * np.sin(FOOTPRINT_ANGLE)
+    across = -cols * np.sin(FOOTPRINT_ANGLE) + rows * np.cos(FOOTPRINT_ANGLE)
+    return (np.abs(along) < FOOTPRINT_EXTENT * width) & (np.abs(across) < FOOTPRINT_EXTENT * height)
+
+
+def upsample(field, width, row_start, row_count):
+    """Expand the rows of a coarse field covering the given scene rows to full resolution."""
+    first_cell, last_cell = row_start // CELL_SIZE, (row_start + row_count - 1) // CELL_SIZE
+    rows = field[first_cell:last_cell + 1].repeat(CELL_SIZE, axis=0).repeat(CELL_SIZE, axis=1)
+    offset = row_start - first_cell * CELL_SIZE
+    return rows[offset:offset + row_count, :width]
+
+
+def to_dn(values, mult, add):
+    """Scale physical values to the uint16 DNs of the product, 0 being fill."""
+    return np.clip(np.round((values - add) / mult), 1, 65535).astype(np.uint16)
+
+
+def write_bands(folder, name, width, height, index):
+    """Write the SR, ST and QA_PIXEL GeoTIFFs strip by strip. Returns the cloud cover (%) of the footprint."""
+    transform, _ = get_grid(width, height)
+    land, cloud = make_fields(width, height, index)
+    rng = np.random.default_rng([index, 1])
+    profile = dict(driver='GTiff', width=width, height=height, count=1, dtype='uint16', crs=f'EPSG:{EPSG}',
+                   transform=transform, tiled=True, blockxsize=BLOCK_SIZE, blockysize=BLOCK_SIZE,
+                   compress='deflate', predictor=2)
+    # Seasonal surface temperature, in Kelvin
+    season = 8 * np.cos(2 * np.pi * (FIRST_ACQUISITION.timetuple().tm_yday + REVISIT_DAYS * index) / 365.25)
+
+    valid_pixels = cloudy_pixels = 0
+    with contextlib.ExitStack() as stack:
+        outputs = {band: stack.enter_context(rasterio.open(os.path.join(folder, f'{name}_{band}.TIF'), 'w',
+                                                             nodata=QA_FILL if band == 'QA_PIXEL' else 0,
+                                                             **profile))
+                   for band in BAND_NAMES}
+
+        for row_start in range(0, height, BLOCK_SIZE):
+            row_count = min(BLOCK_SIZE, height - row_start)
+            window = Window(0, row_start, width, row_count)
+            inside = get_footprint_mask(width, height, row_start, row_count)
+            strip_land = upsample(land, width, row_start, row_count)
+            strip_cloud = upsample(cloud, width, row_start, row_count) & inside
+            noise = rng.normal(0, 0.01, strip_land.shape).astype(np.float32)
+            valid_pixels += int(inside.sum())
+            cloudy_pixels += int(strip_cloud.sum())
+
+            for band, dark, gain in SR_BANDS:
+                reflectance = np.where(strip_cloud, CLOUD_REFLECTANCE, dark + gain * strip_land) + noise
+                outputs[band].write(np.where(inside, to_dn(reflectance, SR_MULT, SR_ADD), 0), 1, window=window)
+
+            temperature = np.where(strip_cloud, 265, 288 + season + 12 * strip_land) + 50 * noise
+            outputs['ST_B10'].write(np.where(inside, to_dn(temperature, ST_MULT, ST_ADD), 0), 1, window=window)
+            qa = np.where(strip_cloud, QA_CLOUD, QA_CLEAR)
+            outputs['QA_PIXEL'].write(np.where(inside, qa, QA_FILL).astype(np.uint16), 1, window=window)
+
+    return 100 * cloudy_pixels / max(valid_pixels, 1)
+
+
+def make_mtl(name, index, width, height, cloud_cover):
+    """Return the MTL JSON of a synthetic scene, with the groups and keys of a real Collection 2 L2 MTL."""
+    _, corners = get_grid(width, height)
+    acquired = FIRST_ACQUISITION + datetime.timedelta(days=REVISIT_DAYS * index)
+    projection_attributes = {'MAP_PROJECTION': 'UTM', 'DATUM': 'WGS84', 'UTM_ZONE': str(EPSG - 32600),
+                             'GRID_CELL_SIZE_REFLECTIVE': f'{PIXEL_SIZE:.2f}',
+                             'REFLECTIVE_LINES': str(height), 'REFLECTIVE_SAMPLES': str(width)}
+    for corner, (longitude, latitude) in corners.items():
+        projection_attributes[f'CORNER_{corner}_LAT_PRODUCT'] = f'{latitude:.5f}'
+        projection_attributes[f'CORNER_{corner}_LON_PRODUCT'] = f'{longitude:.5f}'
+
+    return {'LANDSAT_METADATA_FILE': {
+        'PRODUCT_CONTENTS': {
+            'LANDSAT_PRODUCT_ID': name, 'PROCESSING_LEVEL': 'L2SP', 'COLLECTION_NUMBER': '02',
+            **{f'FILE_NAME_BAND_{band}': f'{name}_SR_B{band}.TIF' for band in range(1, 8)},
+            'FILE_NAME_BAND_ST_B10': f'{name}_ST_B10.TIF',
+            'FILE_NAME_QUALITY_L1_PIXEL': f'{name}_QA_PIXEL.TIF',
+        },
+        'IMAGE_ATTRIBUTES': {
+            'SPACECRAFT_ID': 'LANDSAT_8', 'SENSOR_ID': 'OLI_TIRS', 'STATION_ID': 'ASA', 'WRS_TYPE': '2',
+            'WRS_PATH': str(WRS_PATH), 'WRS_ROW': str(WRS_ROW), 'DATE_ACQUIRED': acquired.isoformat(),
+            'SCENE_CENTER_TIME': '23:52:41.1234560Z', 'IMAGE_QUALITY_OLI': '9', 'IMAGE_QUALITY': '9',
+            'CLOUD_COVER': f'{cloud_cover:.2f}', 'CLOUD_COVER_LAND': f'{cloud_cover:.2f}',
+            'SUN_AZIMUTH': f'{55 + index % 23 * 1.5:.8f}', 'SUN_ELEVATION': f'{25 + index % 23 * 1.3:.8f}',
+            'EARTH_SUN_DISTANCE': '0.9833364',
+        },
+        'PROJECTION_ATTRIBUTES': projection_attributes,
+        'LEVEL2_SURFACE_REFLECTANCE_PARAMETERS': {
+            **{f'REFLECTANCE_MULT_BAND_{band}': f'{SR_MULT:.4E}' for band in range(1, 8)},
+            **{f'REFLECTANCE_ADD_BAND_{band}': f'{SR_ADD:.6f}' for band in range(1, 8)},
+        },
+        'LEVEL2_SURFACE_TEMPERATURE_PARAMETERS': {
+            'TEMPERATURE_MULT_BAND_ST_B10': f'{ST_MULT:.8f}', 'TEMPERATURE_ADD_BAND_ST_B10': f'{ST_ADD:.6f}',
+        },
+    }}
+
+
+def make_stac(name, index, width, height, product, bands, cloud_cover):
+    """Return the SR or ST STAC item of a synthetic scene."""
+    _, corners = get_grid(width, height)
+    ring = [list(corners[corner]) for corner in ('UL', 'UR', 'LR', 'LL', 'UL')]
+    longitudes, latitudes = zip(*ring)
+    acquired = FIRST_ACQUISITION + datetime.timedelta(days=REVISIT_DAYS * index)
+    return {
+        'type': 'Feature', 'stac_version': '1.0.0', 'id': f'{name}_{product}',
+        'bbox': [min(longitudes), min(latitudes), max(longitudes), max(latitudes)],
+        'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+        'properties': {'datetime': f'{acquired.isoformat()}T23:52:41.123456Z', 'eo:cloud_cover': cloud_cover,
+                       'platform': 'LANDSAT_8', 'landsat:wrs_path': f'{WRS_PATH:03d}',
+                       'landsat:wrs_row': f'{WRS_ROW:03d}', 'proj:epsg': EPSG, 'proj:shape': [height, width]},
+        'assets': {band: {'href': f'{name}_{band}.TIF', 'type': 'image/vnd.stac.geotiff; cloud-optimized=true'}
+                   for band in bands},
+    }
+
+
+def write_json(path, data):
+    """Write a JSON file indented like the USGS metadata files."""
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=2)
+
+
+def make_scene(raw_data_folder, index, width=FULL_WIDTH, height=FULL_HEIGHT, archive=False):
+    """Write the index-th synthetic scene into raw_data, as an extracted folder or as a .tar bundle only.
+
+    The scene is written into a hidden folder first, so a partial scene is never listed. Returns
+    (name, bytes written, seconds); an existing scene is left untouched and reported with 0 bytes.
+    """
+    start = time.perf_counter()
+    name = get_scene_name(index)
+    folder = os.path.join(raw_data_folder, name)
+    archive_path = f'{folder}.tar'
+    if os.path.exists(archive_path if archive else folder):
+        return name, 0, time.perf_counter() - start
+
+    temporary_folder = os.path.join(raw_data_folder, f'.{name}.generating')
+    shutil.rmtree(temporary_folder, ignore_errors=True)
+    os.makedirs(temporary_folder)
+
+    cloud_cover = write_bands(temporary_folder, name, width, height, index)
+    write_json(os.path.join(temporary_folder, f'{name}_MTL.json'), make_mtl(name, index, width, height, cloud_cover))
+    write_json(os.path.join(temporary_folder, f'{name}_SR_stac.json'),
+               make_stac(name, index, width, height, 'SR', BAND_NAMES[:7] + ['QA_PIXEL'], cloud_cover))
+    write_json(os.path.join(temporary_folder, f'{name}_ST_stac.json'),
+               make_stac(name, index, width, height, 'ST', ['ST_B10'], cloud_cover))
+
+    if archive:
+        # USGS bundles are uncompressed tars with the files at their root
+        with tarfile.open(f'{archive_path}.tmp', 'w') as tar:
+            for file_name in sorted(os.listdir(temporary_folder)):
+                tar.add(os.path.join(temporary_folder, file_name), arcname=file_name)
+        os.replace(f'{archive_path}.tmp', archive_path)
+        shutil.rmtree(temporary_folder)
+        size = os.path.getsize(archive_path)
+    else:
+        size = sum(entry.stat().st_size for entry in os.scandir(temporary_folder))
+        os.replace(temporary_folder, folder)
+
+    return name, size, time.perf_counter() - start
+
+
+def make_scenes(root_directory, count, width=FULL_WIDTH, height=FULL_HEIGHT, archive=False, max_workers=1):
+    """Generate the first `count` synthetic scenes in <root>/raw_data, skipping those already there.
+
+    Returns the scene names, in acquisition order.
+    """
+    raw_data_folder = os.path.join(root_directory, 'raw_data')
+    os.makedirs(raw_data_folder, exist_ok=True)
+
+    start = time.perf_counter()
+    jobs = [(raw_data_folder, index, width, height, archive) for index in range(count)]
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(make_scene, *zip(*jobs)))
+    else:
+        results = [make_scene(*job) for job in jobs]
+
+    written = [(size, seconds) for _, size, seconds in results if size]
+    total_bytes = sum(size for size, _ in written)
+    print(f"{len(written)} synthetic scenes ({width}x{height}) written, {len(results) - len(written)} already there, "
+          f"{total_bytes / 1e6:.1f} MB in {time.perf_counter() - start:.2f} s.")
+    return [name for name, _, _ in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic Landsat Collection 2 Level-2 scenes (SR_B1-B7, "
+                                                 "ST_B10 and QA_PIXEL tiled GeoTIFFs, MTL and STAC JSON) into "
+                                                 "<root>/raw_data, for benchmarking without USGS downloads.")
+    parser.add_argument("root_directory")
+    parser.add_argument("--scenes", type=int, default=1)
+    parser.add_argument("--width", type=int, default=FULL_WIDTH)
+    parser.add_argument("--height", type=int, default=FULL_HEIGHT)
+    parser.add_argument("--tar", action="store_true", help="Write each scene as a .tar bundle only, as downloaded")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    make_scenes(args.root_directory, args.scenes, args.width, args.height, args.tar, args.workers)
+
+
+if __name__ == "__main__":
+    main()
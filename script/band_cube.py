@@ -0,0 +1,126 @@
+import functools
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import rasterio
+
+from instrumentation import instrumented
+from scale_factors import convert_dn, read_scale_factors
+from scene_bands import get_band_paths, get_scene_file_fingerprint
+from scene_registry import get_scene_registry
+
+# Memory-mapped (band, row, col) uint16 array and its sidecar metadata
+BandCube = namedtuple('BandCube', ['data', 'metadata'])
+
+
+def get_cube_paths(folder_path, folder_name):
+    """Return the paths of the cube array (.npy) and its sidecar JSON for a scene."""
+    base_name = os.path.join(folder_path, folder_name)
+    return f'{base_name}_cube.npy', f'{base_name}_cube.json'
+
+
+def build_band_cube(folder_path, folder_name, band_paths=None):
+    """Convert a scene's SR_B1-B7 and ST_B10 GeoTIFFs into one uncompressed, memory-mapped cube.
+
+    Bands are copied block by block, so memory use stays bounded. Returns the cube path.
+    """
+    band_paths = band_paths or get_band_paths(folder_path, folder_name)
+    cube_path, sidecar_path = get_cube_paths(folder_path, folder_name)
+    os.makedirs(folder_path, exist_ok=True)  # Scenes read straight from their .tar have no folder yet
+
+    with rasterio.open(band_paths['B1']) as src:
+        height, width = src.height, src.width
+        crs, transform = src.crs.to_wkt(), src.transform
+
+    # Write to a temporary file first so an interrupted ingest never leaves a partial cube behind
+    temporary_path = f'{cube_path}.tmp'
+    cube = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=np.uint16,
+                                     shape=(len(band_paths), height, width))
+    for band_index, band_path in enumerate(band_paths.values()):
+        with rasterio.open(band_path) as src:
+            for _, window in src.block_windows(1):
+                cube[band_index][window.toslices()] = src.read(1, window=window)
+    cube.flush()
+    del cube
+    os.replace(temporary_path, cube_path)
+
+    metadata = {
+        'bands': list(band_paths),
+        'shape': [len(band_paths), height, width],
+        'dtype': 'uint16',
+        'crs': crs,
+        'transform': list(transform)[:6],
+        # Bands the cube was built from, so a cube of since replaced bands is never served
+        'band_fingerprints': {band_name: get_scene_file_fingerprint(band_path)
+                              for band_name, band_path in band_paths.items()},
+        'scale_factors': {band_name: {'mult': mult, 'add': add}
+                          for band_name, (mult, add) in read_scale_factors(folder_path).items()},
+    }
+    with open(sidecar_path, 'w') as sidecar_file:
+        json.dump(metadata, sidecar_file, indent=4)
+
+    return cube_path
+
+
+@functools.lru_cache(maxsize=32)
+def load_band_cube(cube_path, sidecar_path, cube_mtime_ns, sidecar_mtime_ns):
+    """Memory-map a band cube and read its sidecar (cached per modification time of both files)."""
+    with open(sidecar_path, 'r') as sidecar_file:
+        metadata = json.load(sidecar_file)
+    return BandCube(np.load(cube_path, mmap_mode='r'), metadata)
+
+
+def open_band_cube(folder_path, folder_name, band_paths=None):
+    """Memory-map a scene's band cube, or return None if the scene has not been ingested.
+
+    A cube built from other versions of the scene's bands (e.g. after a re-download) is ignored too,
+    so callers fall back to the bands until the cube is rebuilt.
+    """
+    cube_path, sidecar_path = get_cube_paths(folder_path, folder_name)
+    try:
+        cube_mtime_ns, sidecar_mtime_ns = os.stat(cube_path).st_mtime_ns, os.stat(sidecar_path).st_mtime_ns
+    except OSError:
+        return None
+
+    cube = load_band_cube(cube_path, sidecar_path, cube_mtime_ns, sidecar_mtime_ns)
+    band_paths = band_paths or get_band_paths(folder_path, folder_name)
+    band_fingerprints = {band_name: get_scene_file_fingerprint(band_path)
+                         for band_name, band_path in band_paths.items()}
+    if cube.metadata.get('band_fingerprints') != band_fingerprints:
+        return None
+    return cube
+
+
+def read_cube_values(cube, x, y):
+    """Return the SR (B1-B7) and ST in Kelvin (B10) values at (x, y) of a band cube, fill as NaN."""
+    _, height, width = cube.data.shape
+    if not (0 <= x < width and 0 <= y < height):
+        raise IndexError(f"Pixel ({x}, {y}) is outside the {width}x{height} cube.")
+
+    # One strided read across the band axis, served from the page cache
+    dns = cube.data[:, y, x]
+    values = {}
+    for band_name, dn in zip(cube.metadata['bands'], dns):
+        factors = cube.metadata['scale_factors'][band_name]
+        values[band_name] = float(convert_dn(dn, factors['mult'], factors['add']))
+    return values
+
+
+@instrumented('cubes')
+def build_band_cubes(root_directory):
+    """Ingest every scene in raw_data into a memory-mapped band cube."""
+    raw_data_folder = os.path.join(root_directory, 'raw_data')
+
+    if not os.path.exists(raw_data_folder):
+        print(f"The specified folder '{raw_data_folder}' does not exist.")
+        return
+
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        print(f"Processing folder: {scene.folder_path}")
+        try:
+            cube_path = build_band_cube(scene.folder_path, folder_name, scene.band_paths)
+            print(f"Band cube written to {cube_path}.\n")
+        except rasterio.errors.RasterioIOError as e:
+            print(f"Error reading bands in {folder_name}: {e}\n")
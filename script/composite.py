@@ -0,0 +1,182 @@
+import os
+import time
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+
+from pixel_resolver import get_georeference, is_inside, latlon_to_rowcol
+from process_data import read_json_file
+from scale_factors import FILL_VALUE
+from scene_registry import get_scene_registry
+from stack_img import compute_percentile_limits, write_scaled_rgb
+
+# Surface Reflectance bands written to the composite, in order
+COMPOSITE_BANDS = ('B1', 'B2', 'B3', 'B4', 'B5', 'B6', 'B7')
+
+# Side of the square spatial chunks processed by each worker
+CHUNK_SIZE = 512
+
+# QA_PIXEL bits of fill, dilated cloud, cloud and cloud shadow; pixels with any of them set are not clear
+QA_MASK_BITS = (1 << 0) | (1 << 1) | (1 << 3) | (1 << 4)
+
+# QA_PIXEL value of fill, given to the composite grid outside a scene's QA raster
+QA_FILL_VALUE = 1 << 0
+
+# Warped datasets of the composite's inputs, opened once per worker process
+_aligned_datasets = {}
+
+
+def get_scene_cloud_cover(mtl_file_path):
+    """Return the scene's CLOUD_COVER from its MTL JSON, or 100 when it is unknown."""
+    if not mtl_file_path:
+        return 100.0
+
+    image_attributes = read_json_file(mtl_file_path)["LANDSAT_METADATA_FILE"].get("IMAGE_ATTRIBUTES", {})
+    return float(image_attributes.get("CLOUD_COVER", 100))
+
+
+def find_composite_scenes(root_directory, latitude=None, longitude=None):
+    """Return the scene inputs of raw_data covering a location (or all scenes), clearest first.
+
+    Each input is (band paths in COMPOSITE_BANDS order, QA_PIXEL path or None).
+    """
+    scenes = []
+
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        band_paths = scene.band_paths
+
+        # Bands found in the scene folder or its .tar
+        if not all(os.path.basename(band_paths[band]) in scene.files for band in COMPOSITE_BANDS):
+            continue
+
+        if latitude is not None and longitude is not None:
+            rows, cols = latlon_to_rowcol(band_paths['B1'], [latitude], [longitude])
+            if not is_inside(band_paths['B1'], rows, cols)[0]:
+                continue
+
+        scenes.append((get_scene_cloud_cover(scene.mtl_path),
+                       tuple(band_paths[band] for band in COMPOSITE_BANDS),
+                       scene.qa_path))
+
+    # Clearest scenes first, so 'best-qa' prefers them
+    return [(band_paths, qa_path) for _, band_paths, qa_path in sorted(scenes, key=lambda scene: scene[0])]
+
+
+def open_aligned(path, grid, nodata=FILL_VALUE):
+    """Open a band warped onto the composite grid (crs, transform, width, height), kept open per worker.
+
+    Pixels of the grid outside the band read as `nodata`.
+    """
+    key = (path, grid, nodata)
+    if key not in _aligned_datasets:
+        crs, transform, width, height = grid
+        _aligned_datasets[key] = WarpedVRT(rasterio.open(path), crs=crs, transform=rasterio.Affine(*transform),
+                                           width=width, height=height, nodata=nodata,
+                                           resampling=Resampling.nearest)
+    return _aligned_datasets[key]
+
+
+def composite_chunk(scenes, grid, window, method):
+    """Composite one spatial chunk of every scene. Returns (window, uint16 array of the SR bands)."""
+    # Mask of the clear observations of every scene, from QA_PIXEL when available, and never where
+    # the scene has no data (outside its raster or footprint)
+    clear = np.empty((len(scenes), window.height, window.width), dtype=bool)
+    for index, (band_paths, qa_path) in enumerate(scenes):
+        clear[index] = open_aligned(band_paths[0], grid).read(1, window=window) != FILL_VALUE
+        if qa_path:
+            qa = open_aligned(qa_path, grid, nodata=QA_FILL_VALUE).read(1, window=window)
+            clear[index] &= (qa & QA_MASK_BITS) == 0
+
+    # The scene used by 'best-qa' is the first (clearest) one with a clear observation
+    best_scene = np.argmax(clear, axis=0)
+    has_clear = clear.any(axis=0)
+
+    # Bands are composited one at a time so only one band of every scene is held in memory
+    output = np.zeros((len(COMPOSITE_BANDS), window.height, window.width), dtype=np.uint16)
+    for band_index in range(len(COMPOSITE_BANDS)):
+        stack = np.stack([open_aligned(band_paths[band_index], grid).read(1, window=window)
+                          for band_paths, _ in scenes])
+        stack_clear = clear & (stack != FILL_VALUE)
+
+        if method == 'median':
+            values = np.where(stack_clear, stack, np.nan).astype(np.float32)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # Pixels without any clear observation
+                median = np.nanmedian(values, axis=0)
+            output[band_index] = np.where(np.isnan(median), FILL_VALUE, np.round(median))
+        else:
+            best = np.take_along_axis(stack, best_scene[np.newaxis], axis=0)[0]
+            output[band_index] = np.where(has_clear, best, FILL_VALUE)
+
+    return window, output
+
+
+def write_chunks(dst, futures):
+    """Write the finished chunks of the composite to the output dataset."""
+    for future in futures:
+        window, output = future.result()
+        dst.write(output, window=window)
+
+
+def create_composite(root_directory, latitude=None, longitude=None, method='median', max_workers=None,
+                     chunk_size=CHUNK_SIZE):
+    """Build a per-pixel SR composite and its RGB image from every scene in raw_data covering a location.
+
+    `method` is 'median' (median of the clear observations) or 'best-qa' (clear observation of the
+    scene with the lowest cloud cover). Scenes are warped onto the grid of the clearest scene and
+    processed in spatial chunks across a process pool, so memory stays bounded with many dates.
+    Returns the path of the SR composite.
+    """
+    if method not in ('median', 'best-qa'):
+        raise ValueError(f"Unknown method '{method}', expected 'median' or 'best-qa'.")
+
+    scenes = find_composite_scenes(root_directory, latitude, longitude)
+    if not scenes:
+        print("No scenes found for the composite.")
+        return None
+    print(f"Compositing {len(scenes)} scenes with the '{method}' method...")
+    start = time.perf_counter()
+
+    georeference = get_georeference(scenes[0][0][0])
+    grid = (georeference.crs, tuple(georeference.transform)[:6], georeference.width, georeference.height)
+
+    folder_name = f"composite_{method}"
+    output_directory = os.path.join(root_directory, 'results', folder_name)
+    os.makedirs(output_directory, exist_ok=True)
+    sr_file = os.path.join(output_directory, f"composite_SR_{method}.tif")
+
+    profile = {
+        'driver': 'GTiff', 'height': georeference.height, 'width': georeference.width,
+        'count': len(COMPOSITE_BANDS), 'dtype': 'uint16', 'crs': georeference.crs,
+        'transform': georeference.transform, 'nodata': FILL_VALUE, 'tiled': True,
+        'blockxsize': chunk_size, 'blockysize': chunk_size, 'compress': 'deflate',
+    }
+    windows = [Window(col_off, row_off, min(chunk_size, georeference.width - col_off),
+                      min(chunk_size, georeference.height - row_off))
+               for row_off in range(0, georeference.height, chunk_size)
+               for col_off in range(0, georeference.width, chunk_size)]
+
+    max_workers = max_workers or os.cpu_count()
+    with rasterio.open(sr_file, 'w', **profile) as dst, ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Keep a bounded number of chunks in flight so finished chunks never pile up in memory
+        pending = set()
+        for window in windows:
+            pending.add(executor.submit(composite_chunk, scenes, grid, window, method))
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_chunks(dst, done)
+        write_chunks(dst, pending)
+
+    # RGB composite from the SR composite's Red, Green and Blue bands, with a percentile stretch
+    with rasterio.open(sr_file) as src:
+        bands = [rasterio.band(src, COMPOSITE_BANDS.index(band) + 1) for band in ('B4', 'B3', 'B2')]
+        lows, highs = compute_percentile_limits(bands)
+        write_scaled_rgb(bands, os.path.join(output_directory, f"stacked_img_{folder_name}.tif"), lows, highs)
+
+    print(f"Composite written to {output_directory} in {time.perf_counter() - start:.2f} s.")
+    return sr_file
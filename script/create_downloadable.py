@@ -2,6 +2,9 @@ import os
 import json
 import pandas as pd
 
+from instrumentation import instrumented
+from scene_registry import get_scene_registry
+
 def format_json_to_hierarchical_csv_with_gaps(json_file, csv_file):
     """Converts a JSON file to a hierarchical CSV format with keys grouped under categories and row gaps."""
     try:
@@ -31,6 +34,7 @@ def format_json_to_hierarchical_csv_with_gaps(json_file, csv_file):
     except Exception as e:
         print(f"Error converting '{json_file}' to hierarchical CSV: {e}")
 
+@instrumented('downloadables')
 def process_data_and_convert_to_csv(root_folder):
     """Processes all folders within the specified root folder, extracting data from MTL JSON files and converting to CSV."""
     raw_data_folder = os.path.join(root_folder, 'raw_data')
@@ -45,29 +49,26 @@ def process_data_and_convert_to_csv(root_folder):
     downloadables_folder = os.path.join(root_folder, 'results')
     os.makedirs(downloadables_folder, exist_ok=True)
 
-    # Traverse through each folder in raw_data
-    for folder_name in os.listdir(raw_data_folder):
-        folder_path = os.path.join(raw_data_folder, folder_name)
-
-        if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_path}")
-            output_file_name = f"{os.path.basename(folder_path)}_SUMMARY.json"
-            json_file_path = os.path.join(folder_path, output_file_name)
+    # Traverse through each scene in raw_data
+    for folder_name, scene in get_scene_registry(root_folder).items():
+        print(f"Processing folder: {scene.folder_path}")
+        json_file_path = scene.summary_path
 
-            if os.path.exists(json_file_path):
-                # Create a subfolder for the corresponding CSV file
-                subfolder_path = os.path.join(downloadables_folder, os.path.basename(folder_path))
-                os.makedirs(subfolder_path, exist_ok=True)
+        if os.path.exists(json_file_path):
+            # Create a subfolder for the corresponding CSV file
+            subfolder_path = scene.results_folder
+            os.makedirs(subfolder_path, exist_ok=True)
 
-                # Prepare the CSV file path
-                csv_file_path = os.path.join(subfolder_path, f"data_{os.path.basename(folder_path)}.csv")
+            # Prepare the CSV file path
+            csv_file_path = os.path.join(subfolder_path, f"data_{folder_name}.csv")
 
-                # Convert JSON to a hierarchical CSV format with row gaps
-                format_json_to_hierarchical_csv_with_gaps(json_file_path, csv_file_path)
-            else:
-                print(f"No summary JSON file found in '{folder_name}'.")
+            # Convert JSON to a hierarchical CSV format with row gaps
+            format_json_to_hierarchical_csv_with_gaps(json_file_path, csv_file_path)
+        else:
+            print(f"No summary JSON file found in '{folder_name}'.")
 
 # Example usage
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-process_data_and_convert_to_csv(root_directory)
\ No newline at end of file
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    process_data_and_convert_to_csv(root_directory)
@@ -1,14 +1,132 @@
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
+import requests
 from landsatxplore.api import API
-from landsatxplore.earthexplorer import EarthExplorer
+from landsatxplore.earthexplorer import DATA_PRODUCTS, EE_DOWNLOAD_URL, EarthExplorer
 import landsatxplore.errors
 from datetime import datetime
 
+from footprint_index import update_footprint_index
+from instrumentation import measure
+from scene_bands import get_scene_archive
+from scene_catalog import DEFAULT_TTL_SECONDS, cached_search, get_catalog_path
+
+
+def find_downloaded_scene(output_directory, product_id):
+    """Return the path of a scene already downloaded: its .tar, next to or moved into the folder it was
+    extracted into, or that folder if the .tar is gone. None when the scene is not there.
+    """
+    folder_path = os.path.join(output_directory, product_id)
+    return get_scene_archive(folder_path) or (folder_path if os.path.isdir(folder_path) else None)
+
+
+def resolve_download_url(ee, entity_id, dataset, timeout=300):
+    """Ask EarthExplorer for the URL of a scene's bundle, trying each data product of the dataset."""
+    for data_product_id in DATA_PRODUCTS[dataset]:
+        url = EE_DOWNLOAD_URL.format(data_product_id=data_product_id, entity_id=entity_id)
+        with ee.session.get(url, allow_redirects=False, timeout=timeout) as response:
+            response.raise_for_status()
+            content = response.json()
+        if content.get("url") and not content.get("errorMessage"):
+            return content["url"]
+
+    raise landsatxplore.errors.EarthExplorerError(f"No downloadable product found for {entity_id}.")
+
+
+def download_file(session, url, output_path, timeout=300, chunk_size=64 * 1024):
+    """Download a file, resuming a partial `<output_path>.part` with an HTTP Range request.
+
+    The file is only moved to `output_path` once complete. Returns the number of bytes transferred.
+    """
+    partial_path = f"{output_path}.part"
+    downloaded_bytes = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+    headers = {"Range": f"bytes={downloaded_bytes}-"} if downloaded_bytes else {}
+
+    with session.get(url, headers=headers, stream=True, allow_redirects=True, timeout=timeout) as response:
+        # 416: the partial file already holds every byte
+        if response.status_code != 416:
+            response.raise_for_status()
+
+            # 206 continues the partial file, a plain 200 means the server restarted from the first byte
+            file_mode = "ab" if response.status_code == 206 else "wb"
+            transferred = 0
+            with open(partial_path, file_mode) as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    transferred += len(chunk)
+
+            expected_size = response.headers.get("Content-Length")
+            if expected_size is not None and transferred < int(expected_size):
+                raise requests.exceptions.ConnectionError(
+                    f"Connection closed after {transferred} of {expected_size} bytes.")
+        else:
+            transferred = 0
+
+    os.replace(partial_path, output_path)
+    return transferred
+
+
+def download_scene(session, product_id, get_url, output_directory, retries=3, backoff=2.0, timeout=300):
+    """Download one scene to `<product_id>.tar`, retrying with exponential backoff.
+
+    `get_url` is called on every attempt, since download URLs expire. Returns the path of the .tar.
+    """
+    output_path = os.path.join(output_directory, f"{product_id}.tar")
+
+    for attempt in range(retries + 1):
+        try:
+            start = time.perf_counter()
+            transferred = download_file(session, get_url(), output_path, timeout=timeout)
+            seconds = time.perf_counter() - start
+            print(f"{product_id} downloaded: {transferred / 1e6:.1f} MB in {seconds:.1f} s.")
+            return output_path
+        except (requests.exceptions.RequestException, landsatxplore.errors.EarthExplorerError) as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt
+            print(f"Error downloading {product_id} ({e}), retrying in {delay:.0f} s...")
+            time.sleep(delay)
+
+
+def download_scenes(session, jobs, output_directory, max_workers=4, retries=3, backoff=2.0, timeout=300,
+                    metrics=None):
+    """Download many scenes with a bounded thread pool, skipping scenes that already exist.
+
+    `jobs` is a list of (product_id, get_url). Returns a dictionary mapping each product ID to its
+    .tar path (the scene folder for a scene extracted without its .tar), or None if the download failed.
+    The metrics record of every scene downloaded (or failed) is appended to `metrics`, if given.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+
+    def run_job(job):
+        product_id, get_url = job
+        downloaded_path = find_downloaded_scene(output_directory, product_id)
+        if downloaded_path:
+            print(f"{product_id} already downloaded, skipped.")
+            return product_id, downloaded_path
+        # With several workers, CPU, peak RSS and I/O are those of the whole process while this scene downloads
+        try:
+            with measure('download', product_id) as record:
+                downloaded_path = download_scene(session, product_id, get_url, output_directory, retries, backoff,
+                                                 timeout)
+        except (requests.exceptions.RequestException, landsatxplore.errors.EarthExplorerError) as e:
+            print(f"Error downloading scene {product_id}: {e}")
+            downloaded_path = None
+        if metrics is not None:
+            metrics.append(record)
+        return product_id, downloaded_path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(run_job, jobs))
+
 
 def download_landsat_data(username, password, landsat_product_id, latitude, longitude, start_date, end_date,
-                          cloud_cover, root_directory, most_recent):
+                          cloud_cover, root_directory, most_recent, max_workers=4, retries=3,
+                          catalog_ttl=DEFAULT_TTL_SECONDS, metrics=None):
     # Scene footprints
     output_directory = os.path.join(root_directory, 'raw_data')
     scene_footprints_directory = os.path.join(root_directory, 'scene_footprints')
@@ -17,104 +135,63 @@ def download_landsat_data(username, password, landsat_product_id, latitude, long
     api = API(username, password)
     ee = EarthExplorer(username, password)
 
-    # Create the output directory if it doesn't exist
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
+    try:
+        # Create the output directory if it doesn't exist
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory)
 
-    if most_recent:
-        start_date = '2024-01-01'
-        today_date = datetime.today().date()
-        end_date = today_date.strftime('%Y-%m-%d')  # Format it as YYYY-MM-DD
+        if most_recent:
+            start_date = '2024-01-01'
+            today_date = datetime.today().date()
+            end_date = today_date.strftime('%Y-%m-%d')  # Format it as YYYY-MM-DD
 
-    # Search for the specified Landsat scene
-    scenes = api.search(
-        dataset=landsat_product_id,
-        latitude=latitude,
-        longitude=longitude,
-        start_date=start_date,
-        end_date=end_date,
-        max_cloud_cover=cloud_cover
-    )
+        # Search for the specified Landsat scene, reusing identical searches from the local catalog
+        scenes = cached_search(api, get_catalog_path(root_directory), landsat_product_id, latitude, longitude,
+                               start_date, end_date, cloud_cover, ttl_seconds=catalog_ttl)
 
-    print(f"{len(scenes)} scenes found.")
+        print(f"{len(scenes)} scenes found.")
 
-    if most_recent:
-        if scenes:
-            most_recent_scene = scenes[0]  # Get the first (most recent) scene
-            print(f"Most recent scene found: {most_recent_scene}")
-
-            # Process the most recent scene
-            acquisition_date = most_recent_scene['acquisition_date'].strftime('%Y-%m-%d')
-            product_id = most_recent_scene['landsat_product_id']
+        if most_recent:
+            if scenes:
+                print(f"Most recent scene found: {scenes[0]}")
+            else:
+                print("No scenes found for the most recent query.")
+            scenes = scenes[:1]  # Only the first (most recent) scene
 
+        # Write scene footprints to disk and queue every scene for download
+        os.makedirs(scene_footprints_directory, exist_ok=True)
+        jobs = []
+        for scene in scenes:
+            acquisition_date = scene['acquisition_date'].strftime('%Y-%m-%d')
+            product_id = scene['landsat_product_id']
             print(f"Acquisition Date: {acquisition_date}, Product ID: {product_id}")
 
-            # Write scene footprints to disk in the output directory
             geojson_filename = os.path.join(scene_footprints_directory,
                                             f"{product_id}.geojson")  # Save in scene footprints directory
             with open(geojson_filename, "w") as f:
-                json.dump(most_recent_scene['spatial_coverage'].__geo_interface__, f)
-
-            # Download surface reflectance data
-            try:
-                print(f"Downloading surface reflectance data for scene {product_id}...")
-                ee.download(most_recent_scene['entity_id'], output_dir=output_directory)
-                print(f"Surface reflectance data for {product_id} downloaded successfully.")
-
-                # Extract LEVEL1_MIN_MAX_REFLECTANCE from the downloaded JSON file
-                reflectance_file_path = os.path.join(output_directory,
-                                                     f"{product_id}.json")  # Adjust the filename accordingly
-                if os.path.exists(reflectance_file_path):  # Ensure the file exists
-                    with open(reflectance_file_path, 'r') as reflectance_file:
-                        reflectance_data = json.load(reflectance_file)
-                        min_max_reflectance = reflectance_data.get("LEVEL1_MIN_MAX_REFLECTANCE", {})
-                        return min_max_reflectance  # Return the extracted reflectance data
-                else:
-                    print(f"Warning: Reflectance file '{reflectance_file_path}' not found after download.")
-
-            except landsatxplore.errors.EarthExplorerError as e:
-                print(f"Error downloading scene {product_id}: {e}")
-
-        else:
-            print("No scenes found for the most recent query.")
-
-    else:
-        # Normal processing for all scenes
-        for scene in scenes:
-            acquisition_date = scene['acquisition_date'].strftime('%Y-%m-%d')
-            product_id = scene['landsat_product_id']
-
-            if product_id == scene['landsat_product_id']:
-                print(f"Acquisition Date: {acquisition_date}, Product ID: {product_id}")
-
-                # Write scene footprints to disk in the output directory
-                geojson_filename = os.path.join(scene_footprints_directory,
-                                                f"{product_id}.geojson")  # Save in scene footprints directory
-                with open(geojson_filename, "w") as f:
-                    json.dump(scene['spatial_coverage'].__geo_interface__, f)
-
-                # Download surface reflectance data
-                try:
-                    print(f"Downloading surface reflectance data for scene {product_id}...")
-                    ee.download(scene['entity_id'], output_dir=output_directory)
-                    print(f"Surface reflectance data for {product_id} downloaded successfully.")
-
-                    # Extract LEVEL1_MIN_MAX_REFLECTANCE from the downloaded JSON file
-                    reflectance_file_path = os.path.join(output_directory,
-                                                         f"{product_id}.json")  # Adjust the filename accordingly
-                    if os.path.exists(reflectance_file_path):  # Ensure the file exists
-                        with open(reflectance_file_path, 'r') as reflectance_file:
-                            reflectance_data = json.load(reflectance_file)
-                            min_max_reflectance = reflectance_data.get("LEVEL1_MIN_MAX_REFLECTANCE", {})
-                            return min_max_reflectance  # Return the extracted reflectance data
-                    else:
-                        print(f"Warning: Reflectance file '{reflectance_file_path}' not found after download.")
-
-                except landsatxplore.errors.EarthExplorerError as e:
-                    print(f"Error downloading scene {product_id}: {e}")
-
-    # Logout from both API and EarthExplorer
-    api.logout()
-    ee.logout()
+                json.dump(scene['spatial_coverage'].__geo_interface__, f)
+
+            jobs.append((product_id, partial(resolve_download_url, ee, scene['entity_id'], landsat_product_id)))
+
+        # Add the new footprints to the spatial index used for point-in-scene lookups
+        update_footprint_index(scene_footprints_directory)
+
+        # Download surface reflectance data
+        print(f"Downloading surface reflectance data for {len(jobs)} scenes with {max_workers} workers...")
+        downloaded = download_scenes(ee.session, jobs, output_directory, max_workers=max_workers, retries=retries,
+                                     metrics=metrics)
+    finally:
+        # Logout from both API and EarthExplorer, even when a search or download fails
+        api.logout()
+        ee.logout()
+
+    # Extract LEVEL1_MIN_MAX_REFLECTANCE from the JSON of the first downloaded scene that has one
+    for product_id, path in downloaded.items():
+        reflectance_file_path = os.path.join(output_directory,
+                                             f"{product_id}.json")  # Adjust the filename accordingly
+        if path and os.path.exists(reflectance_file_path):  # Ensure the file exists
+            with open(reflectance_file_path, 'r') as reflectance_file:
+                reflectance_data = json.load(reflectance_file)
+                return reflectance_data.get("LEVEL1_MIN_MAX_REFLECTANCE", {})  # Return the extracted reflectance data
 
     return "No data was found for the given Landsat parameters"  # Return None if no data was found for the given Landsat ID
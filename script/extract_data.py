@@ -1,36 +1,158 @@
 import os
 import tarfile
 import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 
+from instrumentation import measure
+
+# Members the pipeline reads: SR bands, surface temperature, QA_PIXEL (composites), MTL and STAC metadata
+PIPELINE_MEMBERS = (
+    '_SR_B1.TIF', '_SR_B2.TIF', '_SR_B3.TIF', '_SR_B4.TIF', '_SR_B5.TIF', '_SR_B6.TIF', '_SR_B7.TIF',
+    '_ST_B10.TIF', '_QA_PIXEL.TIF', '_MTL.json', '_SR_stac.json', '_ST_stac.json',
+)
+
+# Buffer used to stream each member out of the archive
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def extract_members(tar, tar_folder, members):
+    """Stream the files of an open archive whose name ends with one of `members` into a folder.
+
+    Members that are not wanted are skipped without being read or written.
+    Returns (number of files, bytes written).
+    """
+    count = total_bytes = 0
+    for member in tar:
+        if not (member.isfile() and member.name.endswith(tuple(members))):
+            continue
+
+        # Landsat bundles are flat; the base name also keeps files inside tar_folder
+        output_path = os.path.join(tar_folder, os.path.basename(member.name))
+        with tar.extractfile(member) as source, open(output_path, 'wb') as output:
+            shutil.copyfileobj(source, output, COPY_BUFFER_SIZE)
+        os.utime(output_path, (member.mtime, member.mtime))
+
+        count += 1
+        total_bytes += member.size
+    return count, total_bytes
+
+
+def link_entry(source, destination):
+    """Hard-link a file (or a folder's files) to a new path, copying where links are not supported."""
+    if os.path.isdir(source):
+        shutil.copytree(source, destination, copy_function=link_entry)
+        return
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def extract_archive(directory, item, members=None):
+    """Extract one .tar of `directory` into a folder named after it, then move the .tar inside.
+
+    Files are extracted into a hidden temporary folder renamed into place once complete, so a
+    crashed extraction never leaves a half-populated scene folder. Files already in the scene
+    folder (e.g. outputs of scenes read from their .tar) are linked into the new folder and the old
+    folder is only deleted once the new one is in place, so no crash ever loses them.
+    Returns (item, number of files, bytes written, seconds, error message or None).
+    """
+    file_path = os.path.join(directory, item)
+    # Create a directory based on the .tar file name (without extension)
+    tar_folder = os.path.join(directory, os.path.splitext(item)[0])
+    temporary_folder = os.path.join(directory, f".{os.path.splitext(item)[0]}.extracting")
+    replaced_folder = os.path.join(directory, f".{os.path.splitext(item)[0]}.replaced")
+    start = time.perf_counter()
+
+    try:
+        # Left over by a crashed extraction: the old folder is restored if it was moved aside but the
+        # new one never took its place; the temporary folder only holds links to the old folder's files
+        if os.path.isdir(replaced_folder):
+            if os.path.isdir(tar_folder):
+                shutil.rmtree(replaced_folder)
+            else:
+                os.rename(replaced_folder, tar_folder)
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        os.makedirs(temporary_folder)
+
+        # Extract the .tar file contents into the temporary folder
+        with tarfile.open(file_path, "r") as tar:
+            if members is None:
+                tar.extractall(path=temporary_folder)
+                file_members = [member for member in tar.getmembers() if member.isfile()]
+                count, total_bytes = len(file_members), sum(member.size for member in file_members)
+            else:
+                count, total_bytes = extract_members(tar, temporary_folder, members)
+
+        # Swap the complete folder into place, keeping what the existing folder already held
+        if os.path.isdir(tar_folder):
+            with os.scandir(tar_folder) as entries:
+                for entry in entries:
+                    if not os.path.exists(os.path.join(temporary_folder, entry.name)):
+                        link_entry(entry.path, os.path.join(temporary_folder, entry.name))
+            os.rename(tar_folder, replaced_folder)
+            os.rename(temporary_folder, tar_folder)
+            shutil.rmtree(replaced_folder)
+        else:
+            os.rename(temporary_folder, tar_folder)
+
+        # Move the .tar file into the folder after extraction
+        shutil.move(file_path, os.path.join(tar_folder, item))
+        return item, count, total_bytes, time.perf_counter() - start, None
+
+    except Exception as e:
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        return item, 0, 0, time.perf_counter() - start, str(e)
+
+
+def measure_extract_archive(directory, item, members=None):
+    """Run extract_archive under measure, in the worker process so the record covers this archive only.
+
+    Returns (extract_archive's result, metrics record).
+    """
+    with measure('extract', os.path.splitext(item)[0]) as record:
+        result = extract_archive(directory, item, members)
+    record['error'] = result[4]
+    return result, record
 
 
 # Function to extract .tar files and store them in separate directories
-def extract_tar_files(directory):
-    # List all the files in the directory
-    for item in os.listdir(directory):
-        if item.endswith(".tar"):  # Only process .tar files
-            file_path = os.path.join(directory, item)
-            # Create a directory based on the .tar file name (without extension)
-            tar_folder = os.path.join(directory, os.path.splitext(item)[0])
-            if not os.path.exists(tar_folder):
-                os.makedirs(tar_folder)  # Create the folder if it doesn't exist
-
-            try:
-                # Extract the .tar file contents into the new folder
-                with tarfile.open(file_path, "r") as tar:
-                    print(f"Extracting {item} into {tar_folder}...")
-                    tar.extractall(path=tar_folder)  # Extract contents into the new folder
-                    print(f"{item} extracted successfully into {tar_folder}.")
-
-                # Move the .tar file into the folder after extraction
-                new_tar_path = os.path.join(tar_folder, item)
-                shutil.move(file_path, new_tar_path)
-                print(f"Moved {item} to {tar_folder}.")
-
-            except Exception as e:
-                print(f"Error extracting {item}: {e}")
-
-def extract_data(root_directory):
+# `members` is a whitelist of member name suffixes (e.g. PIPELINE_MEMBERS); None extracts everything
+def extract_tar_files(directory, members=None, max_workers=1, metrics=None):
+    """Extract every .tar of a directory, in a process pool when `max_workers` > 1.
+
+    The metrics record of every archive is appended to `metrics`, if given.
+    """
+    # List all the .tar files in the directory
+    items = [item for item in os.listdir(directory) if item.endswith(".tar")]
+    print(f"Extracting {len(items)} archives with {max_workers} workers...")
+    start = time.perf_counter()
+
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(measure_extract_archive, [directory] * len(items), items, [members] * len(items))
+            results = list(results)
+    else:
+        results = [measure_extract_archive(directory, item, members) for item in items]
+
+    if metrics is not None:
+        metrics.extend(record for _, record in results)
+    results = [result for result, _ in results]
+
+    for item, count, total_bytes, seconds, error in results:
+        if error:
+            print(f"Error extracting {item}: {error}")
+        else:
+            print(f"{count} files ({total_bytes / 1e6:.1f} MB) of {item} extracted in {seconds:.2f} s "
+                  f"({total_bytes / 1e6 / max(seconds, 1e-9):.1f} MB/s).")
+
+    total_mb = sum(total_bytes for _, _, total_bytes, _, _ in results) / 1e6
+    seconds = time.perf_counter() - start
+    print(f"Extracted {total_mb:.1f} MB in {seconds:.2f} s ({total_mb / max(seconds, 1e-9):.1f} MB/s).")
+    return results
+
+def extract_data(root_directory, members=PIPELINE_MEMBERS, max_workers=1, metrics=None):
     output_directory = os.path.join(root_directory, 'raw_data')
-    extract_tar_files(output_directory)
+    extract_tar_files(output_directory, members, max_workers, metrics)
     print("Extraction process complete.")
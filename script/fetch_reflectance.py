@@ -1,33 +1,53 @@
 import rasterio
+from rasterio.windows import Window
 import numpy as np
+import pandas as pd
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
-def dn_to_sr(dn):
-    """Convert DN to Surface Reflectance."""
-    return 2.75e-05 * dn - 0.2
+from band_cube import open_band_cube, read_cube_values
+from instrumentation import instrumented
+from pixel_resolver import is_inside, latlon_to_rowcol
+from scale_factors import FILL_VALUE, convert_dn, read_scale_factors
+from scene_bands import DEFAULT_SCALE_FACTORS, get_band_paths
+from scene_registry import get_scene_registry
 
-def dn_to_temperature(dn):
-    """Convert DN to Surface Temperature in Kelvin."""
-    return 0.00341802 * dn + 149.0
+def dn_to_sr(dn, scale_factors=DEFAULT_SCALE_FACTORS['B1']):
+    """Convert DN to Surface Reflectance using the band's (multiplier, offset), fill becomes NaN."""
+    return convert_dn(dn, *scale_factors)
 
-def read_band_and_convert_to_sr(band_path, x, y):
+def dn_to_temperature(dn, scale_factors=DEFAULT_SCALE_FACTORS['B10']):
+    """Convert DN to Surface Temperature in Kelvin using the band's (multiplier, offset), fill becomes NaN."""
+    return convert_dn(dn, *scale_factors)
+
+def read_pixel_dn(src, x, y):
+    """Read the DN at (x, y) from an open dataset without decoding the whole band."""
+    if not (0 <= x < src.width and 0 <= y < src.height):
+        raise IndexError(f"Pixel ({x}, {y}) is outside the {src.width}x{src.height} band.")
+
+    # A 1x1 window only makes GDAL decode the internal block that contains (x, y)
+    return src.read(1, window=Window(x, y, 1, 1))[0, 0]
+
+def read_band_and_convert_to_sr(band_path, x, y, scale_factors=DEFAULT_SCALE_FACTORS['B1']):
     """Read a Landsat band TIFF file and convert the DN at (x, y) to Surface Reflectance."""
     with rasterio.open(band_path) as src:
         # Read the pixel value at (x, y)
-        dn = src.read(1)[y, x]  # Note that y, x indexing is used
-        sr = dn_to_sr(dn)
+        dn = read_pixel_dn(src, x, y)
+        sr = float(dn_to_sr(dn, scale_factors))
         return sr
 
-def read_band_and_convert_to_temp(band_path, x, y):
+def read_band_and_convert_to_temp(band_path, x, y, scale_factors=DEFAULT_SCALE_FACTORS['B10']):
     """Read the B10 TIFF file and convert the DN at (x, y) to Surface Temperature in Celsius."""
     with rasterio.open(band_path) as src:
         # Read the pixel value at (x, y)
-        dn = src.read(1)[y, x]  # Note that y, x indexing is used
-        temp_kelvin = dn_to_temperature(dn)
+        dn = read_pixel_dn(src, x, y)
+        temp_kelvin = float(dn_to_temperature(dn, scale_factors))
         temp_celsius = temp_kelvin - 273.15  # Convert Kelvin to Celsius
         return temp_kelvin, temp_celsius
 
+@instrumented('fetch')
 def fetch_reflectance(root_directory, pixel_x, pixel_y):
     # Traverse all subdirectories in the root directory
     fetch_path = os.path.join(root_directory, "raw_data")
@@ -38,40 +58,53 @@ def fetch_reflectance(root_directory, pixel_x, pixel_y):
         print(f"{fetch_path} is not a valid directory.")
         return
 
-    # Traverse all subdirectories within "raw_data"
-    for folder_name in os.listdir(fetch_path):
-        folder_path = os.path.join(fetch_path, folder_name)
-        # print(f"Folder path: {folder_path}")
-
-        # Check if the folder_path is a directory (to avoid processing files)
-        if os.path.isdir(folder_path):
-            print(f'Processing folder: {folder_name}')
-            reflectance_data = get_SR_ST(folder_path, folder_name, pixel_x, pixel_y)  # Pass folder_path here
-
-            # Save the results to a JSON file inside the respective folder
-            json_output_file = os.path.join(folder_path, f"{folder_name}_SR_ST_values.json")
-            with open(json_output_file, 'w') as json_file:
-                json.dump(reflectance_data, json_file, indent=4)
-
-            print(f'Reflectance and temperature data saved to {json_output_file}')
-
-def get_SR_ST(base_path, folder_name, pixel_x, pixel_y):
-    # Construct the full path by appending the folder name once (correct directory structure)
-    full_base_name = os.path.join(base_path, folder_name)
-
-    # Input paths for B1 to B7 bands and B10
-    # print(f"Full path: {full_base_name}")
-
-    band_paths = {
-        'B1': f'{full_base_name}_SR_B1.TIF',
-        'B2': f'{full_base_name}_SR_B2.TIF',
-        'B3': f'{full_base_name}_SR_B3.TIF',
-        'B4': f'{full_base_name}_SR_B4.TIF',
-        'B5': f'{full_base_name}_SR_B5.TIF',
-        'B6': f'{full_base_name}_SR_B6.TIF',
-        'B7': f'{full_base_name}_SR_B7.TIF',
-        'B10': f'{full_base_name}_ST_B10.TIF'  # Path for the temperature band
-    }
+    # Traverse all scenes within "raw_data", extracted folders or .tar bundles
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        # print(f"Folder path: {scene.folder_path}")
+        print(f'Processing folder: {folder_name}')
+        reflectance_data = get_SR_ST(scene.folder_path, folder_name, pixel_x, pixel_y, scene.band_paths)
+        save_reflectance_data(scene.folder_path, folder_name, reflectance_data)
+
+def fetch_reflectance_at_location(root_directory, latitude, longitude):
+    """Same as fetch_reflectance, but for a ground location resolved to pixels in each scene's own grid."""
+    fetch_path = os.path.join(root_directory, "raw_data")
+
+    # Check if the path exists and is a directory
+    if not os.path.isdir(fetch_path):
+        print(f"{fetch_path} is not a valid directory.")
+        return
+
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        print(f'Processing folder: {folder_name}')
+        try:
+            rows, cols = latlon_to_rowcol(scene.band_paths['B1'], [latitude], [longitude])
+        except rasterio.errors.RasterioIOError as e:
+            print(f"Error reading bands in {folder_name}: {e}")
+            continue
+
+        reflectance_data = get_SR_ST(scene.folder_path, folder_name, int(cols[0]), int(rows[0]), scene.band_paths)
+        save_reflectance_data(scene.folder_path, folder_name, reflectance_data)
+
+def save_reflectance_data(folder_path, folder_name, reflectance_data):
+    """Save the SR/ST values of a scene to a JSON file inside its folder."""
+    os.makedirs(folder_path, exist_ok=True)  # Scenes read straight from their .tar have no folder yet
+    json_output_file = os.path.join(folder_path, f"{folder_name}_SR_ST_values.json")
+    with open(json_output_file, 'w') as json_file:
+        json.dump(reflectance_data, json_file, indent=4)
+
+    print(f'Reflectance and temperature data saved to {json_output_file}')
+
+def get_SR_ST(base_path, folder_name, pixel_x, pixel_y, band_paths=None):
+    # Input paths for B1 to B7 bands and B10 (from the scene registry when given)
+    band_paths = band_paths or get_band_paths(base_path, folder_name)
+
+    # Read from the memory-mapped band cube when the scene has been ingested from these bands
+    cube = open_band_cube(base_path, folder_name, band_paths)
+    if cube is not None:
+        return get_SR_ST_from_cube(cube, pixel_x, pixel_y)
+
+    # Otherwise from the bands, with their MTL scale factors
+    scale_factors = read_scale_factors(base_path)
 
     # Initialize a dictionary to store SR and ST values for each band
     reflectance_data = {}
@@ -80,19 +113,199 @@ def get_SR_ST(base_path, folder_name, pixel_x, pixel_y):
     for band_name, band_path in band_paths.items():
         try:
             if band_name == 'B10':
-                temp_kelvin, temp_celsius = read_band_and_convert_to_temp(band_path, pixel_x, pixel_y)
+                temp_kelvin, temp_celsius = read_band_and_convert_to_temp(band_path, pixel_x, pixel_y,
+                                                                          scale_factors[band_name])
                 reflectance_data[band_name] = {
                     'Surface Temperature (K)': temp_kelvin,
                     'Surface Temperature (Celcius)': temp_celsius
                 }
             else:
-                sr_value = read_band_and_convert_to_sr(band_path, pixel_x, pixel_y)
+                sr_value = read_band_and_convert_to_sr(band_path, pixel_x, pixel_y, scale_factors[band_name])
                 reflectance_data[band_name] = {'Surface Reflectance': sr_value}
         except Exception as e:
             reflectance_data[band_name] = f'Error: {e}'
 
     return reflectance_data
 
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-fetch_reflectance(root_directory, 3000, 3000)
\ No newline at end of file
+def get_SR_ST_from_cube(cube, pixel_x, pixel_y):
+    """Same as get_SR_ST, but reading every band at (x, y) from a band cube."""
+    try:
+        values = read_cube_values(cube, pixel_x, pixel_y)
+    except IndexError as e:
+        return {band_name: f'Error: {e}' for band_name in cube.metadata['bands']}
+
+    reflectance_data = {}
+    for band_name, value in values.items():
+        if band_name == 'B10':
+            reflectance_data[band_name] = {
+                'Surface Temperature (K)': value,
+                'Surface Temperature (Celcius)': value - 273.15
+            }
+        else:
+            reflectance_data[band_name] = {'Surface Reflectance': value}
+
+    return reflectance_data
+
+def read_band_points(band_path, cols, rows):
+    """Read the DNs at many (col, row) positions, decoding each internal block only once.
+
+    Points outside the band are returned as the fill value, so they convert to NaN.
+    """
+    with rasterio.open(band_path) as src:
+        values = np.full(len(cols), FILL_VALUE, dtype=src.dtypes[0])
+        block_height, block_width = src.block_shapes[0]
+        blocks_per_row = -(-src.width // block_width)  # Ceiling division
+
+        inside = np.flatnonzero((cols >= 0) & (cols < src.width) & (rows >= 0) & (rows < src.height))
+
+        # Sort the points by the block that holds them so every block is read once
+        block_ids = (rows[inside] // block_height) * blocks_per_row + cols[inside] // block_width
+        order = np.argsort(block_ids, kind='stable')
+        inside, block_ids = inside[order], block_ids[order]
+        unique_blocks, starts = np.unique(block_ids, return_index=True)
+        ends = np.append(starts[1:], len(block_ids))
+
+        for block_id, start, end in zip(unique_blocks, starts, ends):
+            block_row, block_col = divmod(int(block_id), blocks_per_row)
+            row_off, col_off = block_row * block_height, block_col * block_width
+            window = Window(col_off, row_off,
+                            min(block_width, src.width - col_off),
+                            min(block_height, src.height - row_off))
+            block = src.read(1, window=window)
+
+            members = inside[start:end]
+            values[members] = block[rows[members] - row_off, cols[members] - col_off]
+
+    return values
+
+def get_SR_ST_batch(base_path, folder_name, points, coordinate_type='pixel', band_paths=None):
+    """Extract B1-B7 Surface Reflectance and B10 Surface Temperature for many points of one scene.
+
+    `points` is a sequence of (x, y) pixel coordinates, or (lat, lon) pairs when
+    `coordinate_type` is 'latlon'. Returns a DataFrame with one row per point.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    band_paths = band_paths or get_band_paths(base_path, folder_name)
+    scale_factors = read_scale_factors(base_path)
+
+    if coordinate_type == 'latlon':
+        table = pd.DataFrame({'lat': points[:, 0], 'lon': points[:, 1]})
+        rows, cols = latlon_to_rowcol(band_paths['B1'], points[:, 0], points[:, 1])
+    elif coordinate_type == 'pixel':
+        table = pd.DataFrame()
+        cols, rows = points[:, 0].astype(np.int64), points[:, 1].astype(np.int64)
+    else:
+        raise ValueError(f"Unknown coordinate type '{coordinate_type}', expected 'pixel' or 'latlon'.")
+
+    table['x'] = cols
+    table['y'] = rows
+
+    # Loop through bands and convert the DNs of every point at once
+    for band_name, band_path in band_paths.items():
+        dns = read_band_points(band_path, cols, rows)
+        if band_name == 'B10':
+            temp_kelvin = dn_to_temperature(dns, scale_factors[band_name])
+            table['B10 Surface Temperature (K)'] = temp_kelvin
+            table['B10 Surface Temperature (Celcius)'] = temp_kelvin - 273.15
+        else:
+            table[f'{band_name} Surface Reflectance'] = dn_to_sr(dns, scale_factors[band_name])
+
+    return table
+
+def fetch_reflectance_batch(root_directory, points, coordinate_type='pixel'):
+    """Extract SR/ST values for many points in every scene of raw_data.
+
+    Each scene's table is saved as a CSV inside its folder. Returns a dictionary
+    mapping scene names to their DataFrames.
+    """
+    fetch_path = os.path.join(root_directory, "raw_data")
+
+    if not os.path.isdir(fetch_path):
+        print(f"{fetch_path} is not a valid directory.")
+        return {}
+
+    tables = {}
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        print(f'Processing folder: {folder_name}')
+        try:
+            table = get_SR_ST_batch(scene.folder_path, folder_name, points, coordinate_type, scene.band_paths)
+        except rasterio.errors.RasterioIOError as e:
+            print(f"Error reading bands in {folder_name}: {e}")
+            continue
+
+        os.makedirs(scene.folder_path, exist_ok=True)
+        csv_output_file = os.path.join(scene.folder_path, f"{folder_name}_SR_ST_points.csv")
+        table.to_csv(csv_output_file, index=False)
+        tables[folder_name] = table
+
+        print(f'Reflectance and temperature data for {len(table)} points saved to {csv_output_file}')
+
+    return tables
+
+def get_acquisition_date(folder_name):
+    """Parse the acquisition date from a Landsat product ID (LXSS_LLLL_PPPRRR_YYYYMMDD_...)."""
+    try:
+        return datetime.strptime(folder_name.split('_')[3], '%Y%m%d')
+    except (IndexError, ValueError):
+        return None
+
+def get_SR_ST_at_location(folder_path, folder_name, latitude, longitude, band_paths=None):
+    """Return one time-series row of SR/ST values of a scene at a ground location.
+
+    Returns None when the location is outside the scene.
+    """
+    band_paths = band_paths or get_band_paths(folder_path, folder_name)
+    rows, cols = latlon_to_rowcol(band_paths['B1'], [latitude], [longitude])
+    if not is_inside(band_paths['B1'], rows, cols)[0]:
+        return None
+
+    pixel_x, pixel_y = int(cols[0]), int(rows[0])
+    row = {'date': get_acquisition_date(folder_name), 'scene': folder_name, 'x': pixel_x, 'y': pixel_y}
+
+    # Flatten the per-band dictionary into one column per value, errors become NaN
+    for band_name, values in get_SR_ST(folder_path, folder_name, pixel_x, pixel_y, band_paths).items():
+        if isinstance(values, str):
+            print(f"{folder_name} {band_name}: {values}")
+            values = {}
+        if band_name == 'B10':
+            row['B10 Surface Temperature (K)'] = values.get('Surface Temperature (K)', np.nan)
+            row['B10 Surface Temperature (Celcius)'] = values.get('Surface Temperature (Celcius)', np.nan)
+        else:
+            row[f'{band_name} Surface Reflectance'] = values.get('Surface Reflectance', np.nan)
+
+    return row
+
+def fetch_reflectance_timeseries(root_directory, latitude, longitude, max_workers=8):
+    """Query the same ground location in every scene of raw_data concurrently.
+
+    Returns a date-sorted DataFrame with one row per scene covering the location.
+    """
+    fetch_path = os.path.join(root_directory, "raw_data")
+
+    if not os.path.isdir(fetch_path):
+        print(f"{fetch_path} is not a valid directory.")
+        return pd.DataFrame()
+
+    scenes = list(get_scene_registry(root_directory).values())
+
+    def query_scene(scene):
+        try:
+            return get_SR_ST_at_location(scene.folder_path, scene.name, latitude, longitude, scene.band_paths)
+        except rasterio.errors.RasterioIOError as e:
+            print(f"Error reading bands in {scene.name}: {e}")
+            return None
+
+    # GDAL releases the GIL while decoding, so threads overlap the per-scene reads
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rows = [row for row in executor.map(query_scene, scenes) if row is not None]
+
+    print(f"Location ({latitude}, {longitude}) found in {len(rows)} of {len(scenes)} scenes.")
+    if not rows:
+        return pd.DataFrame()
+
+    return pd.DataFrame(rows).sort_values(['date', 'scene']).reset_index(drop=True)
+
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    fetch_reflectance(root_directory, 3000, 3000)
@@ -0,0 +1,93 @@
+import json
+import os
+import pickle
+from collections import namedtuple
+
+import shapely
+from shapely import wkb
+from shapely.geometry import Point, box, shape
+from shapely.strtree import STRtree
+
+INDEX_FILE_NAME = 'footprint_index.pkl'
+
+# Product IDs, footprints, the STRtree built over them and each footprint's position by id()
+FootprintIndex = namedtuple('FootprintIndex', ['product_ids', 'footprints', 'tree', 'positions'])
+
+# Shapely 2 STRtree queries return positions, Shapely 1.8 (pinned by landsatxplore) returns geometries
+SHAPELY_2 = int(shapely.__version__.split('.')[0]) >= 2
+
+# Indexes already loaded by this process, with the file signature they were built from
+_loaded_indexes = {}
+
+
+def scan_footprints(footprints_directory):
+    """Return {product_id: (path, mtime)} of the GeoJSON footprints in a directory."""
+    with os.scandir(footprints_directory) as entries:
+        return {entry.name[:-len('.geojson')]: (entry.path, entry.stat().st_mtime)
+                for entry in entries if entry.is_file() and entry.name.endswith('.geojson')}
+
+
+def update_footprint_index(footprints_directory):
+    """Load the persisted footprint index, parse only new or changed GeoJSON files, and save it back.
+
+    Returns a FootprintIndex ready for point and bbox queries.
+    """
+    footprint_files = scan_footprints(footprints_directory)
+    signature = {product_id: mtime for product_id, (_, mtime) in footprint_files.items()}
+
+    cached = _loaded_indexes.get(footprints_directory)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    # Persisted records are {product_id: (mtime, footprint as WKB)}
+    index_path = os.path.join(footprints_directory, INDEX_FILE_NAME)
+    records = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'rb') as index_file:
+            records = pickle.load(index_file)
+
+    changed = False
+    for product_id in set(records) - set(footprint_files):
+        del records[product_id]  # Footprint file removed
+        changed = True
+
+    for product_id, (path, mtime) in footprint_files.items():
+        if product_id not in records or records[product_id][0] != mtime:
+            with open(path, 'r') as footprint_file:
+                records[product_id] = (mtime, shape(json.load(footprint_file)).wkb)
+            changed = True
+
+    if changed:
+        temporary_path = f'{index_path}.tmp'
+        with open(temporary_path, 'wb') as index_file:
+            pickle.dump(records, index_file)
+        os.replace(temporary_path, index_path)
+
+    product_ids = sorted(records)
+    footprints = [wkb.loads(records[product_id][1]) for product_id in product_ids]
+    positions = {id(footprint): position for position, footprint in enumerate(footprints)}
+    index = FootprintIndex(product_ids, footprints, STRtree(footprints), positions)
+
+    _loaded_indexes[footprints_directory] = (signature, index)
+    return index
+
+
+def query_footprints(index, geometry):
+    """Return the product IDs of the scenes whose footprint intersects a geometry."""
+    # The tree returns bounding-box candidates, which are then tested against the exact footprints
+    candidates = index.tree.query(geometry)
+    if not SHAPELY_2:
+        candidates = [index.positions[id(candidate)] for candidate in candidates]
+
+    return [index.product_ids[position] for position in sorted(candidates)
+            if index.footprints[position].intersects(geometry)]
+
+
+def scenes_covering_point(index, latitude, longitude):
+    """Return the product IDs of the scenes whose footprint covers a location."""
+    return query_footprints(index, Point(longitude, latitude))
+
+
+def scenes_intersecting_bbox(index, min_lon, min_lat, max_lon, max_lat):
+    """Return the product IDs of the scenes whose footprint intersects a bounding box."""
+    return query_footprints(index, box(min_lon, min_lat, max_lon, max_lat))
@@ -0,0 +1,169 @@
+import contextlib
+import functools
+import json
+import os
+import time
+
+try:
+    import resource  # Unix only, used when /proc is not available
+except ImportError:
+    resource = None
+
+# /proc/self/io counters recorded per stage: bytes read from and written to storage, and all read()/write() bytes
+IO_COUNTERS = ('read_bytes', 'write_bytes', 'rchar', 'wchar')
+
+# Prometheus gauges written per stage: (metric name, record field, aggregation, help)
+PROMETHEUS_METRICS = [
+    ('reflectra_stage_runs', None, 'count', "Scenes (or whole-archive runs) of the stage in the last run."),
+    ('reflectra_stage_failures', 'error', 'count', "Failed runs of the stage in the last run."),
+    ('reflectra_stage_wall_seconds', 'wall_seconds', 'sum', "Wall time spent in the stage."),
+    ('reflectra_stage_cpu_seconds', 'cpu_seconds', 'sum', "CPU time spent in the stage, reaped children included."),
+    ('reflectra_stage_peak_rss_bytes', 'peak_rss_bytes', 'max', "Highest peak resident set size of the stage."),
+    ('reflectra_stage_read_bytes', 'read_bytes', 'sum', "Bytes the stage read from storage."),
+    ('reflectra_stage_write_bytes', 'write_bytes', 'sum', "Bytes the stage wrote to storage."),
+]
+
+
+def get_metrics_paths(metrics_directory):
+    """Return the paths of the JSON-lines log and the Prometheus textfile in a metrics directory."""
+    return (os.path.join(metrics_directory, 'pipeline_metrics.jsonl'),
+            os.path.join(metrics_directory, 'reflectra_pipeline.prom'))
+
+
+def get_default_metrics_directory(root_directory):
+    """Return the metrics directory used when none is given: <root>/results/metrics."""
+    return os.path.join(root_directory, 'results', 'metrics')
+
+
+def read_io_counters():
+    """Return this process's /proc/self/io counters, or None where they are not available."""
+    try:
+        with open('/proc/self/io', 'r') as io_file:
+            counters = dict(line.split(':') for line in io_file)
+    except OSError:
+        return None
+    return {name: int(counters[name]) for name in IO_COUNTERS}
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS (VmHWM) of this process, so the next reading covers one stage only."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss():
+    """Return the peak resident set size of this process in bytes, or None."""
+    try:
+        with open('/proc/self/status', 'r') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    # Peak over the process lifetime, in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None
+
+
+def get_cpu_seconds():
+    """CPU time of this process and of its terminated children (e.g. a finished process pool)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+@contextlib.contextmanager
+def measure(stage, scene=None):
+    """Measure the block as one run of a stage, for one scene or the whole archive.
+
+    Yields the record, filled in when the block exits: wall and CPU seconds, peak RSS and the
+    /proc/self/io byte deltas (None where not available). An exception raised by the block is
+    stored in `error` and re-raised.
+    """
+    record = {'stage': stage, 'scene': scene, 'pid': os.getpid(), 'timestamp': time.time(), 'error': None}
+    peak_rss_reset = reset_peak_rss()
+    io_before = read_io_counters()
+    cpu_before = get_cpu_seconds()
+    start = time.perf_counter()
+
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = str(e)
+        raise
+    finally:
+        record['wall_seconds'] = time.perf_counter() - start
+        record['cpu_seconds'] = get_cpu_seconds() - cpu_before
+        record['peak_rss_bytes'] = read_peak_rss()
+        record['peak_rss_per_stage'] = peak_rss_reset  # False: peak over the process lifetime
+        io_after = read_io_counters()
+        for name in IO_COUNTERS:
+            record[name] = io_after[name] - io_before[name] if io_before and io_after else None
+
+
+def format_prometheus(records):
+    """Aggregate the records per stage into Prometheus text exposition format."""
+    stages = sorted({record['stage'] for record in records})
+    lines = []
+
+    for metric, field, aggregation, help_text in PROMETHEUS_METRICS:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for stage in stages:
+            stage_records = [record for record in records if record['stage'] == stage]
+            if aggregation == 'count':
+                value = sum(1 for record in stage_records if field is None or record[field])
+            else:
+                values = [record[field] for record in stage_records if record[field] is not None]
+                if not values:
+                    continue
+                value = max(values) if aggregation == 'max' else sum(values)
+            lines.append(f'{metric}{{stage="{stage}"}} {value}')
+
+    lines += ["# HELP reflectra_pipeline_last_run_timestamp_seconds Time the last pipeline run finished.",
+              "# TYPE reflectra_pipeline_last_run_timestamp_seconds gauge",
+              f"reflectra_pipeline_last_run_timestamp_seconds {time.time()}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics_directory, records):
+    """Append the records to the JSON-lines log and replace the Prometheus textfile with this run's totals."""
+    if not records:
+        return
+
+    os.makedirs(metrics_directory, exist_ok=True)
+    jsonl_path, prometheus_path = get_metrics_paths(metrics_directory)
+    with open(jsonl_path, 'a') as jsonl_file:
+        for record in records:
+            jsonl_file.write(json.dumps(record) + "\n")
+
+    # The textfile collector must never read a half-written file
+    temporary_path = f'{prometheus_path}.tmp'
+    with open(temporary_path, 'w') as prometheus_file:
+        prometheus_file.write(format_prometheus(records))
+    os.replace(temporary_path, prometheus_path)
+
+    print(f"Metrics of {len(records)} stage runs written to {jsonl_path} and {prometheus_path}.")
+
+
+def instrumented(stage):
+    """Decorate a whole-root stage entry point, whose first argument is the root directory.
+
+    main_run and run_pipeline measure the per-scene functions, not these entry points, so a direct
+    call (e.g. from a module's __main__) is measured here as one whole-archive run of `stage` and
+    written to <root>/results/metrics like a main_run run.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(root_directory, *args, **kwargs):
+            records = []
+            try:
+                with measure(stage) as record:
+                    records.append(record)
+                    return function(root_directory, *args, **kwargs)
+            finally:
+                write_metrics(get_default_metrics_directory(root_directory), records)
+        return wrapper
+    return decorator
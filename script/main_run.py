@@ -1,66 +1,122 @@
+import argparse
 import os
-from download_data import download_landsat_data
-from extract_data import extract_data
-from process_data import process_landsat_data
-from script.fetch_reflectance import fetch_reflectance
-from script.process_data import process_data
-from script.visualise_data import visualize_data
-from stack_img import stack_image
-from visualise_data import run_data_visualisation_sr_st
-from visualise_img_attributes import run_data_visualisation_summary
-from create_downloadable import process_data_and_convert_to_csv
-from web_dev_pixel import get_scaled_pixel
-# import API details
+import time
+
+from instrumentation import get_default_metrics_directory, measure, write_metrics
+from pipeline import SCENE_STAGE_NAMES, run_pipeline
+
+# Stage modules are imported inside each stage, so running one stage never pays for the imports
+# (matplotlib, rasterio, landsatxplore...) of the others.
+
+# API KEY - change to your own API key.
+USERNAME = 'YOUR_API_USERNAME'
+PASSWORD = 'YOUR_API_KEY'
+
+# LANDSAT DATA PARAMETERS
+LANDSAT_PRODUCT_ID = 'landsat_ot_c2_l2'
+LATITUDE = -38.1477
+LONGITUDE = 145.3764
+START_DATE = '2023-01-01'  #YYYY-MM-DD
+END_DATE = '2023-10-01'
+CLOUD_COVER = 5
+
+
+# Each whole-archive stage appends the metrics records of its runs to `metrics`
+
+# 1. Download Landsat Data with given parameters (one record per downloaded scene)
+def run_download(root_directory, args, metrics):
+    from download_data import download_landsat_data
+    most_recent = False  # Bool to determine if we need most recent data
+    download_landsat_data(USERNAME, PASSWORD, LANDSAT_PRODUCT_ID, LATITUDE, LONGITUDE, START_DATE, END_DATE,
+                          CLOUD_COVER, root_directory, most_recent, metrics=metrics)
+
+
+# 2. Extract Data (optional: without it, scenes are read straight from their .tar through /vsitar/)
+# One record per extracted archive
+def run_extract(root_directory, args, metrics):
+    from extract_data import extract_data
+    extract_data(root_directory, max_workers=args.workers, metrics=metrics)
+
+
+# 3. Per-scene stages (cubes, process, fetch, stack, visualise, downloadables), see pipeline.SCENE_STAGES.
+# Only the scenes whose inputs changed since the last run are processed, each scene's chain as one task.
+
+
+# Optional: parse every scene's MTL into the metadata catalog, queried with metadata_catalog.query_metadata
+def run_catalog(root_directory, args, metrics):
+    from metadata_catalog import ingest_metadata
+    with measure('catalog') as record:
+        ingest_metadata(root_directory)
+    metrics.append(record)
+
+
+# Whole-archive stages run before and after the per-scene stages
+ARCHIVE_STAGES = {
+    'download': run_download,
+    'extract': run_extract,
+    'catalog': run_catalog,
+}
+
+# Every stage, in pipeline order
+STAGE_NAMES = ['download', 'extract', *SCENE_STAGE_NAMES, 'catalog']
+
+# Stages run when none are given on the command line
+DEFAULT_STAGES = ['process', 'fetch', 'stack', 'visualise-sr-st', 'visualise-summary', 'downloadables']
+
 
 def main():
-    # API KEY - change to your own API key.
-    username = 'YOUR_API_USERNAME'
-    password = 'YOUR_API_KEY'
-
-    # LANDSAT DATA PARAMETERS
-    landsat_product_id = 'landsat_ot_c2_l2'
-    latitude = -38.1477
-    longitude = 145.3764
-    start_date = '2023-01-01'  #YYYY-MM-DD
-    end_date = '2023-10-01'
-    cloud_cover = 5
+    parser = argparse.ArgumentParser(description="Run the Reflectra pipeline, or only the given stages.")
+    parser.add_argument("stages", nargs="*", metavar="stage",
+                        help=f"Stages to run, in pipeline order: {', '.join(STAGE_NAMES)} "
+                             f"(default: {' '.join(DEFAULT_STAGES)})")
+    parser.add_argument("--pixel-x", type=int, default=3000, help="Pixel column queried by the fetch stage")
+    parser.add_argument("--pixel-y", type=int, default=3000, help="Pixel row queried by the fetch stage")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes of the extract stage and of the per-scene scheduler")
+    parser.add_argument("--io-slots", type=int, help="I/O-heavy steps running at once (default: --workers)")
+    parser.add_argument("--cpu-slots", type=int, help="CPU-heavy steps running at once (default: --workers)")
+    parser.add_argument("--force", action="store_true", help="Re-run the per-scene stages of every scene")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the plan of the per-scene stages")
+    parser.add_argument("--metrics-dir", help="Where the JSON-lines metrics log and the Prometheus textfile "
+                                              "are written (default: <root>/results/metrics)")
+    args = parser.parse_args()
+
+    unknown_stages = [stage for stage in args.stages if stage not in STAGE_NAMES]
+    if unknown_stages:
+        parser.error(f"unknown stages {unknown_stages}, expected some of: {', '.join(STAGE_NAMES)}")
+    stages = [stage for stage in STAGE_NAMES if stage in (args.stages or DEFAULT_STAGES)]
 
     # OUTPUT & CURRENT DIRECTORY
     current_directory = os.getcwd()  # Get the current working directory
     root_directory = os.path.dirname(current_directory)  # Move up one directory
     print(root_directory)
 
-    # 1. Download Landsat Data with given parameters
-    # most_recent = False  # Bool to determine if we need most recent data
-    # download_landsat_data(username, password, landsat_product_id, latitude, longitude, start_date, end_date, cloud_cover, root_directory, most_recent)
-
-    # 2. Extract Data
-    # extract_data(root_directory)
-
-    # 3. Processs Data
-    # process_data(root_directory)
-
-    # 4. Fetch reflectance data
-    pixel_x, pixel_y = get_scaled_pixel()
-    fetch_reflectance(root_directory, pixel_x, pixel_y)
-
-    # 5. Stack image
-    stack_image(root_directory)
+    # Wall time, CPU, peak RSS and bytes read/written of every stage run, per scene except for the catalog
+    metrics = []
 
-    # 6. Visualise data
-    run_data_visualisation_sr_st(root_directory)
+    def run_archive_stage(stage):
+        start = time.perf_counter()
+        ARCHIVE_STAGES[stage](root_directory, args, metrics)
+        print(f"Stage '{stage}' completed in {time.perf_counter() - start:.2f} s.\n")
 
-    # 7. Process Data (get SR, radioisometric scaling factors, image attributes, lat & long)
-    process_landsat_data(root_directory)
+    try:
+        # Download and extraction first, as they decide which scenes the per-scene stages see
+        for stage in stages:
+            if stage in ('download', 'extract') and not args.dry_run:
+                run_archive_stage(stage)
 
-    # 8. Visualise Data and store them in /results
-    run_data_visualisation_sr_st(root_directory)
-    run_data_visualisation_summary(root_directory)
+        scene_stages = [stage for stage in stages if stage in SCENE_STAGE_NAMES]
+        if scene_stages:
+            run_pipeline(root_directory, scene_stages, args, force=args.force, dry_run=args.dry_run,
+                         max_workers=args.workers, io_slots=args.io_slots, cpu_slots=args.cpu_slots,
+                         metrics=metrics)
 
-    # 9. Create downloadables
-    process_data_and_convert_to_csv(root_directory)
+        if 'catalog' in stages and not args.dry_run:
+            run_archive_stage('catalog')
+    finally:
+        write_metrics(args.metrics_dir or get_default_metrics_directory(root_directory), metrics)
 
     print("All processes completed.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
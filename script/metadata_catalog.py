@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from process_data import read_json_file
+from scale_factors import get_scale_factors
+from scene_bands import BAND_SUFFIXES, get_scene_file_mtime
+from scene_registry import get_scene_registry
+
+# Typed columns read from the MTL JSON: (column, MTL group, MTL key, SQLite type)
+MTL_COLUMNS = [
+    ('spacecraft_id', 'IMAGE_ATTRIBUTES', 'SPACECRAFT_ID', 'TEXT'),
+    ('sensor_id', 'IMAGE_ATTRIBUTES', 'SENSOR_ID', 'TEXT'),
+    ('wrs_path', 'IMAGE_ATTRIBUTES', 'WRS_PATH', 'INTEGER'),
+    ('wrs_row', 'IMAGE_ATTRIBUTES', 'WRS_ROW', 'INTEGER'),
+    ('date_acquired', 'IMAGE_ATTRIBUTES', 'DATE_ACQUIRED', 'TEXT'),
+    ('scene_center_time', 'IMAGE_ATTRIBUTES', 'SCENE_CENTER_TIME', 'TEXT'),
+    ('cloud_cover', 'IMAGE_ATTRIBUTES', 'CLOUD_COVER', 'REAL'),
+    ('cloud_cover_land', 'IMAGE_ATTRIBUTES', 'CLOUD_COVER_LAND', 'REAL'),
+    ('sun_azimuth', 'IMAGE_ATTRIBUTES', 'SUN_AZIMUTH', 'REAL'),
+    ('sun_elevation', 'IMAGE_ATTRIBUTES', 'SUN_ELEVATION', 'REAL'),
+    ('earth_sun_distance', 'IMAGE_ATTRIBUTES', 'EARTH_SUN_DISTANCE', 'REAL'),
+] + [
+    (f'{corner.lower()}_{axis.lower()}', 'PROJECTION_ATTRIBUTES', f'CORNER_{corner}_{axis}_PRODUCT', 'REAL')
+    for corner in ('UL', 'UR', 'LL', 'LR') for axis in ('LAT', 'LON')
+]
+
+# One (multiplier, offset) column pair per band
+SCALE_FACTOR_COLUMNS = [(f'{band_name.lower()}_{factor}', 'REAL')
+                        for band_name in BAND_SUFFIXES for factor in ('mult', 'add')]
+
+COLUMNS = ([('scene', 'TEXT PRIMARY KEY'), ('mtl_path', 'TEXT NOT NULL'), ('mtl_mtime', 'REAL NOT NULL')]
+           + [(column, sql_type) for column, _, _, sql_type in MTL_COLUMNS] + SCALE_FACTOR_COLUMNS)
+
+CATALOG_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS scene_metadata (
+    {', '.join(f'{column} {sql_type}' for column, sql_type in COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS scene_metadata_by_date ON scene_metadata (date_acquired);
+CREATE INDEX IF NOT EXISTS scene_metadata_by_cloud ON scene_metadata (cloud_cover);
+"""
+
+SQL_CONVERTERS = {'TEXT': str, 'INTEGER': int, 'REAL': float}
+
+
+def get_metadata_catalog_path(root_directory):
+    """Return the path of the metadata catalog of the scenes in raw_data.
+
+    It is kept out of raw_data, whose modification time invalidates the scene registry.
+    """
+    return os.path.join(root_directory, 'scene_footprints', 'metadata_catalog.sqlite')
+
+
+def open_metadata_catalog(catalog_path):
+    """Open (and create if needed) the SQLite metadata catalog."""
+    os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+    connection = sqlite3.connect(catalog_path)
+    connection.executescript(CATALOG_SCHEMA)
+    return connection
+
+
+def make_metadata_row(scene, mtl_path, mtl_mtime, data):
+    """Turn a scene's parsed MTL JSON into a catalog row, in COLUMNS order. Missing values become NULL."""
+    metadata = data.get("LANDSAT_METADATA_FILE", {})
+    row = [scene, mtl_path, mtl_mtime]
+
+    for _, group, key, sql_type in MTL_COLUMNS:
+        # MTL JSON stores numbers as strings
+        value = metadata.get(group, {}).get(key)
+        row.append(None if value is None else SQL_CONVERTERS[sql_type](value))
+
+    for mult, add in get_scale_factors(data).values():
+        row += [mult, add]
+    return row
+
+
+def ingest_metadata(root_directory):
+    """Parse the MTL JSON of new or changed scenes into the catalog and drop scenes no longer in raw_data.
+
+    Scenes are re-parsed only when their MTL modification time changes. Returns (ingested, removed).
+    """
+    raw_data_folder = os.path.join(root_directory, 'raw_data')
+    if not os.path.isdir(raw_data_folder):
+        print(f"The specified folder '{raw_data_folder}' does not exist.")
+        return 0, 0
+
+    start = time.perf_counter()
+    connection = open_metadata_catalog(get_metadata_catalog_path(root_directory))
+    try:
+        known_mtimes = dict(connection.execute("SELECT scene, mtl_mtime FROM scene_metadata"))
+        scenes = get_scene_registry(root_directory)
+
+        rows = []
+        for scene in scenes.values():
+            if not scene.mtl_path:
+                continue
+
+            mtl_mtime = get_scene_file_mtime(scene.mtl_path)
+            if known_mtimes.get(scene.name) != mtl_mtime:
+                rows.append(make_metadata_row(scene.name, scene.mtl_path, mtl_mtime, read_json_file(scene.mtl_path)))
+
+        removed = [(scene,) for scene in known_mtimes if scene not in scenes]
+        with connection:
+            connection.executemany(f"INSERT OR REPLACE INTO scene_metadata VALUES ({', '.join('?' * len(COLUMNS))})",
+                                   rows)
+            connection.executemany("DELETE FROM scene_metadata WHERE scene = ?", removed)
+    finally:
+        connection.close()
+
+    print(f"Metadata catalog: {len(rows)} scenes ingested, {len(removed)} removed, "
+          f"{len(scenes) - len(rows)} unchanged in {time.perf_counter() - start:.2f} s.")
+    return len(rows), len(removed)
+
+
+def query_metadata(root_directory, start_date=None, end_date=None, max_cloud_cover=None, wrs_path=None,
+                   wrs_row=None):
+    """Return the catalogued scenes matching the filters as a date-sorted DataFrame, in one indexed query.
+
+    Dates are 'YYYY-MM-DD' strings and are inclusive.
+    """
+    conditions, parameters = [], []
+    for condition, value in (("date_acquired >= ?", start_date), ("date_acquired <= ?", end_date),
+                             ("cloud_cover <= ?", max_cloud_cover), ("wrs_path = ?", wrs_path),
+                             ("wrs_row = ?", wrs_row)):
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(str(value) if 'date' in condition else value)
+
+    query = "SELECT * FROM scene_metadata"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY date_acquired"
+
+    connection = open_metadata_catalog(get_metadata_catalog_path(root_directory))
+    try:
+        return pd.read_sql_query(query, connection, params=parameters, parse_dates=['date_acquired'])
+    finally:
+        connection.close()
@@ -0,0 +1,316 @@
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from instrumentation import measure
+from scene_bands import get_scene_file_fingerprint
+from scene_registry import get_scene_registry
+
+# A per-scene stage: `inputs` and `outputs` return the paths a scene's run reads and writes,
+# `parameters` the arguments that change its result, `resource` ('io' or 'cpu') the semaphore
+# bounding it in the scheduler, and `run` processes one scene.
+# Stage modules are imported inside the run functions, so planning stays fast.
+SceneStage = namedtuple('SceneStage', ['name', 'inputs', 'outputs', 'parameters', 'resource', 'run'])
+
+# Seconds between two saves of the pipeline state while scenes complete
+STATE_SAVE_INTERVAL = 5.0
+
+# Semaphores bounding the I/O- and CPU-heavy steps across the scheduler's worker processes
+_resource_slots = {}
+
+
+def get_cube_files(scene):
+    """Same paths as band_cube.get_cube_paths, without importing rasterio to plan."""
+    base_name = os.path.join(scene.folder_path, scene.name)
+    return [f'{base_name}_cube.npy', f'{base_name}_cube.json']
+
+
+def get_band_inputs(scene):
+    """Band files of a scene and its MTL when there is one (scale factors fall back to defaults)."""
+    return [*scene.band_paths.values(), *([scene.mtl_path] if scene.mtl_path else [])]
+
+
+def run_cubes(root_directory, scene, args):
+    from band_cube import build_band_cube
+    build_band_cube(scene.folder_path, scene.name, scene.band_paths)
+
+
+def run_process(root_directory, scene, args):
+    from process_data import run_process_data
+    run_process_data(scene.folder_path, scene.mtl_path)
+
+
+def run_fetch(root_directory, scene, args):
+    from fetch_reflectance import get_SR_ST, save_reflectance_data
+    reflectance_data = get_SR_ST(scene.folder_path, scene.name, args.pixel_x, args.pixel_y, scene.band_paths)
+    save_reflectance_data(scene.folder_path, scene.name, reflectance_data)
+
+
+def run_stack(root_directory, scene, args):
+    from stack_img import run_process_data
+    if not run_process_data(scene.folder_path, scene.name, root_directory, scene_files=scene.files):
+        raise FileNotFoundError("Red, Green or Blue band (SR_B4/B3/B2) missing")
+
+
+def run_visualise_sr_st(root_directory, scene, args):
+    from visualise_data import visualize_data
+    os.makedirs(scene.results_folder, exist_ok=True)
+    visualize_data(scene.values_path, root_directory, scene.results_folder)
+
+
+def run_visualise_summary(root_directory, scene, args):
+    from visualise_img_attributes import display_summary_data
+    os.makedirs(scene.results_folder, exist_ok=True)
+    display_summary_data(scene.summary_path, scene.results_folder)
+
+
+def run_downloadables(root_directory, scene, args):
+    from create_downloadable import format_json_to_hierarchical_csv_with_gaps
+    os.makedirs(scene.results_folder, exist_ok=True)
+    format_json_to_hierarchical_csv_with_gaps(scene.summary_path,
+                                              os.path.join(scene.results_folder, f"data_{scene.name}.csv"))
+
+
+# Per-scene stages, in pipeline order. A stage reading another stage's output runs after it.
+SCENE_STAGES = [
+    SceneStage('cubes',
+               lambda root, scene: get_band_inputs(scene),
+               lambda root, scene: get_cube_files(scene),
+               lambda args: {},
+               'io',
+               run_cubes),
+    SceneStage('process',
+               lambda root, scene: [scene.mtl_path],
+               lambda root, scene: [scene.summary_path],
+               lambda args: {},
+               'io',
+               run_process),
+    SceneStage('fetch',
+               lambda root, scene: get_band_inputs(scene),
+               lambda root, scene: [scene.values_path],
+               lambda args: {'pixel_x': args.pixel_x, 'pixel_y': args.pixel_y},
+               'io',
+               run_fetch),
+    SceneStage('stack',
+               lambda root, scene: [scene.band_paths['B4'], scene.band_paths['B3'], scene.band_paths['B2']],
+               lambda root, scene: [os.path.join(scene.results_folder, f"stacked_img_{scene.name}.tif")],
+               lambda args: {},
+               'cpu',
+               run_stack),
+    SceneStage('visualise-sr-st',
+               lambda root, scene: [scene.values_path],
+               lambda root, scene: [os.path.join(scene.results_folder, f"surface_reflectance_{scene.name}.jpg")],
+               lambda args: {},
+               'cpu',
+               run_visualise_sr_st),
+    SceneStage('visualise-summary',
+               lambda root, scene: [scene.summary_path],
+               lambda root, scene: [os.path.join(scene.results_folder, f"summary_{scene.name}.jpg")],
+               lambda args: {},
+               'cpu',
+               run_visualise_summary),
+    SceneStage('downloadables',
+               lambda root, scene: [scene.summary_path],
+               lambda root, scene: [os.path.join(scene.results_folder, f"data_{scene.name}.csv")],
+               lambda args: {},
+               'io',
+               run_downloadables),
+]
+
+SCENE_STAGE_NAMES = [stage.name for stage in SCENE_STAGES]
+
+
+def get_state_path(root_directory):
+    """Return the path of the file recording the input signature of every completed (stage, scene)."""
+    return os.path.join(root_directory, 'results', 'pipeline_state.json')
+
+
+def load_state(root_directory):
+    state_path = get_state_path(root_directory)
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r') as state_file:
+        return json.load(state_file)
+
+
+def save_state(root_directory, state):
+    """Write the state file atomically, so an interrupted run keeps the previous state."""
+    state_path = get_state_path(root_directory)
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    temporary_path = f'{state_path}.tmp'
+    with open(temporary_path, 'w') as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+    os.replace(temporary_path, state_path)
+
+
+def get_signature(input_paths, parameters):
+    """Hash the inputs' paths, sizes and modification times together with the stage parameters."""
+    content = json.dumps({'inputs': [[path, get_scene_file_fingerprint(path)] for path in input_paths],
+                          'parameters': parameters}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def plan_pipeline(root_directory, stage_names, args, force=False):
+    """Decide which (stage, scene) pairs must run.
+
+    A pair runs when its outputs are missing, its input signature differs from the recorded one, or an
+    earlier stage of this run rewrites one of its inputs. Returns {stage name: {scene name: status}} with
+    status 'run', 'up to date' or 'missing inputs'.
+    """
+    registry = get_scene_registry(root_directory)
+    state = load_state(root_directory)
+    rewritten = set()  # Outputs of the pairs planned to run, fresher than what is on disk
+    plan = {}
+
+    for stage in SCENE_STAGES:
+        if stage.name not in stage_names:
+            continue
+
+        statuses = plan[stage.name] = {}
+        for scene in registry.values():
+            input_paths = stage.inputs(root_directory, scene)
+            output_paths = stage.outputs(root_directory, scene)
+
+            if any(path is None or (path not in rewritten and get_scene_file_fingerprint(path) is None)
+                   for path in input_paths):
+                statuses[scene.name] = 'missing inputs'
+                continue
+
+            signature = get_signature(input_paths, stage.parameters(args))
+            if (force or any(path in rewritten for path in input_paths)
+                    or any(not os.path.exists(path) for path in output_paths)
+                    or state.get(stage.name, {}).get(scene.name) != signature):
+                statuses[scene.name] = 'run'
+                rewritten.update(output_paths)
+            else:
+                statuses[scene.name] = 'up to date'
+
+    return plan
+
+
+def print_plan(plan):
+    print("Pipeline plan:")
+    for stage_name, statuses in plan.items():
+        counts = {status: sum(value == status for value in statuses.values())
+                  for status in ('run', 'up to date', 'missing inputs')}
+        print(f"  {stage_name:<18} {counts['run']:>5} to run, {counts['up to date']:>5} up to date, "
+              f"{counts['missing inputs']:>5} missing inputs")
+    print()
+
+
+def init_worker(io_slots, cpu_slots):
+    """Give a worker process the semaphores shared by all workers."""
+    _resource_slots.update(io=io_slots, cpu=cpu_slots)
+
+
+def run_scene_chain(root_directory, scene, stage_names, args):
+    """Run the planned stages of one scene in pipeline order.
+
+    A stage reading the output of a failed stage is skipped. Returns [(stage name, input signature or
+    None on failure, seconds, error message or None, instrumentation record or None when skipped)].
+    """
+    stages = {stage.name: stage for stage in SCENE_STAGES}
+    failed_outputs = set()
+    results = []
+
+    for stage_name in stage_names:
+        stage = stages[stage_name]
+        input_paths = stage.inputs(root_directory, scene)
+        start = time.perf_counter()
+        record = None
+
+        if failed_outputs.intersection(input_paths):
+            error = "skipped, an earlier stage of this scene failed"
+        else:
+            try:
+                # Measured once a slot is free, so waiting for the semaphore is not counted
+                with _resource_slots.get(stage.resource) or contextlib.nullcontext():
+                    with measure(stage_name, scene.name) as record:
+                        stage.run(root_directory, scene, args)
+                error = None
+            except Exception as e:
+                error = str(e)
+
+        if error:
+            failed_outputs.update(stage.outputs(root_directory, scene))
+            results.append((stage_name, None, time.perf_counter() - start, error, record))
+        else:
+            # Signature of the inputs as they were used, recorded once the outputs are written
+            signature = get_signature(input_paths, stage.parameters(args))
+            results.append((stage_name, signature, time.perf_counter() - start, None, record))
+
+    return results
+
+
+def run_pipeline(root_directory, stage_names, args, force=False, dry_run=False, max_workers=1, io_slots=None,
+                 cpu_slots=None, metrics=None):
+    """Plan the given per-scene stages, print the plan and run only the (stage, scene) pairs that need it.
+
+    Every scene's chain of planned stages is one task; with `max_workers` > 1 the scenes run in a
+    process pool, with at most `io_slots` I/O-heavy and `cpu_slots` CPU-heavy steps at a time (both
+    default to `max_workers`). The input signature of every successful pair is recorded, so the next
+    run skips it until its inputs change. The instrumentation record of every pair that ran is
+    appended to `metrics` when given. Returns the plan.
+    """
+    plan = plan_pipeline(root_directory, stage_names, args, force)
+    print_plan(plan)
+    if dry_run:
+        return plan
+
+    registry = get_scene_registry(root_directory)
+    state = load_state(root_directory)
+
+    # The planned stages of every scene, in pipeline order
+    chains = {}
+    for stage_name, statuses in plan.items():
+        for scene_name, status in statuses.items():
+            if status == 'run':
+                chains.setdefault(scene_name, []).append(stage_name)
+
+    stage_seconds = {stage_name: 0.0 for stage_name in plan}
+    stage_counts = {stage_name: 0 for stage_name in plan}
+
+    def record(scene_name, results):
+        for stage_name, signature, seconds, error, metrics_record in results:
+            stage_seconds[stage_name] += seconds
+            if metrics is not None and metrics_record:
+                metrics.append(metrics_record)
+            if error:
+                print(f"Error in stage '{stage_name}' for {scene_name}: {error}")
+                state.get(stage_name, {}).pop(scene_name, None)
+            else:
+                stage_counts[stage_name] += 1
+                state.setdefault(stage_name, {})[scene_name] = signature
+
+    start = time.perf_counter()
+    if max_workers > 1 and chains:
+        io_slots = multiprocessing.Semaphore(io_slots or max_workers)
+        cpu_slots = multiprocessing.Semaphore(cpu_slots or max_workers)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=(io_slots, cpu_slots)) as executor:
+            futures = {executor.submit(run_scene_chain, root_directory, registry[scene_name], chain, args): scene_name
+                       for scene_name, chain in chains.items()}
+
+            last_save = time.perf_counter()
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+                if time.perf_counter() - last_save > STATE_SAVE_INTERVAL:
+                    save_state(root_directory, state)
+                    last_save = time.perf_counter()
+    else:
+        for scene_name, chain in chains.items():
+            record(scene_name, run_scene_chain(root_directory, registry[scene_name], chain, args))
+            save_state(root_directory, state)
+
+    save_state(root_directory, state)
+    for stage_name in plan:
+        print(f"Stage '{stage_name}': {stage_counts[stage_name]} scenes run, "
+              f"{stage_seconds[stage_name]:.2f} s of work.")
+    print(f"{len(chains)} scenes processed with {max_workers} workers in {time.perf_counter() - start:.2f} s.\n")
+
+    return plan
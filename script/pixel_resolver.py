@@ -0,0 +1,58 @@
+import functools
+from collections import namedtuple
+
+import numpy as np
+import rasterio
+from pyproj import Transformer
+
+# CRS (as WKT), affine transform and size of a band
+Georeference = namedtuple('Georeference', ['crs', 'transform', 'width', 'height'])
+
+
+@functools.lru_cache(maxsize=None)
+def get_georeference(band_path):
+    """Read the native CRS and affine transform of a band once and cache them."""
+    with rasterio.open(band_path) as src:
+        return Georeference(src.crs.to_wkt(), src.transform, src.width, src.height)
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(source_crs, target_crs):
+    """Return a cached transformer between two CRSs, with (x, y) = (lon, lat) axis order."""
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
+
+
+def latlon_to_rowcol(band_path, lats, lons):
+    """Convert arrays of latitude/longitude to (row, col) pixel indices of a band in one call.
+
+    Points outside the band are not clipped; use `is_inside` to filter them.
+    """
+    georeference = get_georeference(band_path)
+    xs, ys = get_transformer('EPSG:4326', georeference.crs).transform(
+        np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+
+    # Apply the inverse affine transform to every point at once
+    inverse = ~georeference.transform
+    cols = np.floor(inverse.a * xs + inverse.b * ys + inverse.c).astype(np.int64)
+    rows = np.floor(inverse.d * xs + inverse.e * ys + inverse.f).astype(np.int64)
+    return rows, cols
+
+
+def rowcol_to_latlon(band_path, rows, cols):
+    """Convert arrays of (row, col) pixel indices to the latitude/longitude of the pixel centres."""
+    georeference = get_georeference(band_path)
+    rows = np.asarray(rows, dtype=float) + 0.5
+    cols = np.asarray(cols, dtype=float) + 0.5
+
+    forward = georeference.transform
+    xs = forward.a * cols + forward.b * rows + forward.c
+    ys = forward.d * cols + forward.e * rows + forward.f
+    lons, lats = get_transformer(georeference.crs, 'EPSG:4326').transform(xs, ys)
+    return lats, lons
+
+
+def is_inside(band_path, rows, cols):
+    """Return a boolean mask of the (row, col) indices that fall inside the band."""
+    georeference = get_georeference(band_path)
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    return (rows >= 0) & (rows < georeference.height) & (cols >= 0) & (cols < georeference.width)
@@ -2,20 +2,19 @@ import os
 import json
 from datetime import datetime
 
+from instrumentation import instrumented
+from scene_bands import find_mtl_file, list_scene_files, read_scene_json
+from scene_registry import get_scene_registry
+
 
 def find_mtl_json(folder_path):
-    """Finds a file containing 'MTL' in its name in the given folder path."""
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if 'MTL' in file and file.endswith('.json'):
-                return os.path.join(root, file)  # Return the first matching file
-    return None
+    """Finds a file containing 'MTL' in its name in the given scene folder or its .tar."""
+    return find_mtl_file(list_scene_files(folder_path))
 
 
 def read_json_file(file_path):
-    """Reads a JSON file and returns its content."""
-    with open(file_path, 'r') as file:
-        return json.load(file)
+    """Reads a JSON file (extracted or a /vsitar/ archive member) and returns its content."""
+    return read_scene_json(file_path)
 
 
 def extract_image_attributes(data):
@@ -72,8 +71,9 @@ def write_extracted_data_to_json(extracted_data, output_file):
     print(f"Extracted data has been written to {output_file}")
 
 
-def run_process_data(folder_path):
-    mtl_file_path = find_mtl_json(folder_path)
+def run_process_data(folder_path, mtl_file_path=None):
+    # The scene registry already knows the MTL path; otherwise look for it in the folder
+    mtl_file_path = mtl_file_path or find_mtl_json(folder_path)
 
     if mtl_file_path:
         print(f"Found JSON file containing 'MTL' at: {mtl_file_path}")
@@ -103,6 +103,7 @@ def run_process_data(folder_path):
         # Create output file name by appending '_SUMMARY' to the folder name
         output_file_name = f"{os.path.basename(folder_path)}_SUMMARY.json"
         output_file_path = os.path.join(folder_path, output_file_name)
+        os.makedirs(folder_path, exist_ok=True)  # Scenes read straight from their .tar have no folder yet
 
         # Write the extracted data to a JSON file
         write_extracted_data_to_json(extracted_data, output_file_path)
@@ -114,6 +115,7 @@ def run_process_data(folder_path):
         return None
 
 
+@instrumented('process')
 def process_data(root_folder):
     """Processes all folders within the specified root folder, extracting data from MTL JSON files."""
     # Construct the full path to the raw_data folder
@@ -126,25 +128,22 @@ def process_data(root_folder):
         print(f"Contents of the parent directory: {os.listdir(os.path.dirname(raw_data_folder))}")
         return
 
-    # Traverse through each folder in raw_data
-    for folder_name in os.listdir(raw_data_folder):
-        folder_path = os.path.join(raw_data_folder, folder_name)
-
-        # Check if the folder is a directory
-        if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_path}")
-            extracted_data = run_process_data(folder_path)
+    # Traverse through each scene in raw_data, extracted folders or .tar bundles
+    for folder_name, scene in get_scene_registry(root_folder).items():
+        print(f"Processing folder: {scene.folder_path}")
+        extracted_data = run_process_data(scene.folder_path, scene.mtl_path)
 
-            if extracted_data:
-                print(f"Data extracted successfully from {folder_name}.\n")
-            else:
-                print(f"No MTL JSON found in {folder_name}.\n")
+        if extracted_data:
+            print(f"Data extracted successfully from {folder_name}.\n")
+        else:
+            print(f"No MTL JSON found in {folder_name}.\n")
 
 
 # Call the process_data function with the absolute path to the script's parent directory
 def process_landsat_data(root_directory):
     process_data(root_directory)
 
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-process_landsat_data(root_directory)
\ No newline at end of file
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    process_landsat_data(root_directory)
@@ -0,0 +1,65 @@
+import functools
+
+import numpy as np
+
+from process_data import find_mtl_json, read_json_file
+from scene_bands import DEFAULT_SCALE_FACTORS, get_scene_file_mtime
+
+# Collection 2 Level-2 fill value of the SR and ST bands
+FILL_VALUE = 0
+
+
+def read_scale_factors(folder_path):
+    """Read the (multiplier, offset) of every band from the scene's MTL JSON.
+
+    REFLECTANCE_MULT/ADD are used for B1-B7 and TEMPERATURE_MULT/ADD for B10.
+    Bands missing from the MTL, or scenes without one, keep the Collection 2 defaults.
+    """
+    mtl_file_path = find_mtl_json(folder_path)
+    if not mtl_file_path:
+        return dict(DEFAULT_SCALE_FACTORS)
+
+    return read_mtl_scale_factors(mtl_file_path, get_scene_file_mtime(mtl_file_path))
+
+
+@functools.lru_cache(maxsize=64)
+def read_mtl_scale_factors(mtl_file_path, mtime):
+    """Return the scale factors of an MTL JSON (cached per MTL modification time)."""
+    return get_scale_factors(read_json_file(mtl_file_path))
+
+
+def get_scale_factors(data):
+    """Return the (multiplier, offset) of every band from parsed MTL JSON, defaults for missing bands."""
+    scale_factors = dict(DEFAULT_SCALE_FACTORS)
+    metadata = data.get("LANDSAT_METADATA_FILE", {})
+    reflectance_parameters = metadata.get("LEVEL2_SURFACE_REFLECTANCE_PARAMETERS", {})
+    temperature_parameters = metadata.get("LEVEL2_SURFACE_TEMPERATURE_PARAMETERS", {})
+
+    for band_name in scale_factors:
+        if band_name == 'B10':
+            mult = temperature_parameters.get("TEMPERATURE_MULT_BAND_ST_B10")
+            add = temperature_parameters.get("TEMPERATURE_ADD_BAND_ST_B10")
+        else:
+            band_number = band_name[1:]
+            mult = reflectance_parameters.get(f"REFLECTANCE_MULT_BAND_{band_number}")
+            add = reflectance_parameters.get(f"REFLECTANCE_ADD_BAND_{band_number}")
+
+        # MTL JSON stores the coefficients as strings
+        if mult is not None and add is not None:
+            scale_factors[band_name] = (float(mult), float(add))
+
+    return scale_factors
+
+
+@functools.lru_cache(maxsize=None)
+def get_lookup_table(mult, add):
+    """Build a read-only 65,536-entry uint16 -> float32 table of mult * DN + add, with fill as NaN."""
+    lookup_table = (np.arange(65536, dtype=np.float64) * mult + add).astype(np.float32)
+    lookup_table[FILL_VALUE] = np.nan
+    lookup_table.flags.writeable = False
+    return lookup_table
+
+
+def convert_dn(dn, mult, add):
+    """Convert a uint16 DN, or a whole array of them, with a single table lookup."""
+    return np.take(get_lookup_table(mult, add), dn)
@@ -0,0 +1,135 @@
+import functools
+import json
+import os
+import tarfile
+
+# File suffixes of the bands used by Reflectra, B1-B7 Surface Reflectance and B10 Surface Temperature
+BAND_SUFFIXES = {
+    'B1': '_SR_B1.TIF',
+    'B2': '_SR_B2.TIF',
+    'B3': '_SR_B3.TIF',
+    'B4': '_SR_B4.TIF',
+    'B5': '_SR_B5.TIF',
+    'B6': '_SR_B6.TIF',
+    'B7': '_SR_B7.TIF',
+    'B10': '_ST_B10.TIF'  # Temperature band
+}
+
+# Collection 2 Level-2 (multiplier, offset) used to convert DNs to SR and ST (Kelvin)
+DEFAULT_SCALE_FACTORS = {band_name: (2.75e-05, -0.2) for band_name in BAND_SUFFIXES if band_name != 'B10'}
+DEFAULT_SCALE_FACTORS['B10'] = (0.00341802, 149.0)
+
+# Scene bundles as downloaded from EarthExplorer, read in place through GDAL's virtual filesystem
+ARCHIVE_EXTENSION = '.tar'
+VSITAR_PREFIX = '/vsitar/'
+
+
+def list_scenes(raw_data_folder):
+    """Return {scene name: scene folder} of raw_data, including scenes only downloaded as a .tar.
+
+    The folder of a scene that was never extracted does not exist yet; outputs written there create it.
+    """
+    scenes = {}
+    with os.scandir(raw_data_folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue  # Hidden, e.g. a scene being extracted
+            if entry.is_dir():
+                scenes[entry.name] = entry.path
+            elif entry.is_file() and entry.name.endswith(ARCHIVE_EXTENSION):
+                scene_name = entry.name[:-len(ARCHIVE_EXTENSION)]
+                scenes.setdefault(scene_name, os.path.join(raw_data_folder, scene_name))
+    return dict(sorted(scenes.items()))
+
+
+def get_scene_archive(folder_path):
+    """Return the .tar of a scene, next to its folder or moved into it by extract_data, or None."""
+    folder_path = folder_path.rstrip(os.sep)
+    folder_name = os.path.basename(folder_path)
+    for archive_path in (f'{folder_path}{ARCHIVE_EXTENSION}',
+                         os.path.join(folder_path, f'{folder_name}{ARCHIVE_EXTENSION}')):
+        if os.path.isfile(archive_path):
+            return archive_path
+    return None
+
+
+@functools.lru_cache(maxsize=64)
+def list_archive_members(archive_path, mtime):
+    """Return {file name: member name} of the files in an archive (cached per archive modification time)."""
+    with tarfile.open(archive_path, 'r') as tar:
+        return {os.path.basename(member.name): member.name for member in tar if member.isfile()}
+
+
+def list_scene_files(folder_path):
+    """Return {file name: path} of a scene's files.
+
+    Members of the scene's .tar get /vsitar/ paths that rasterio opens without extraction;
+    files already extracted to the scene folder take precedence.
+    """
+    scene_files = {}
+    archive_path = get_scene_archive(folder_path)
+    if archive_path:
+        members = list_archive_members(archive_path, os.path.getmtime(archive_path))
+        scene_files.update({file_name: f'{VSITAR_PREFIX}{archive_path}/{member_name}'
+                            for file_name, member_name in members.items()})
+
+    if os.path.isdir(folder_path):
+        with os.scandir(folder_path) as entries:
+            scene_files.update({entry.name: entry.path for entry in entries if entry.is_file()})
+    return scene_files
+
+
+def split_archive_path(path):
+    """Split a /vsitar/ path into (archive path, member name)."""
+    archive_path, member_name = path[len(VSITAR_PREFIX):].split(f'{ARCHIVE_EXTENSION}/', 1)
+    return f'{archive_path}{ARCHIVE_EXTENSION}', member_name
+
+
+def get_scene_file_mtime(path):
+    """Return the modification time of a scene file; archive members use the archive's."""
+    if path.startswith(VSITAR_PREFIX):
+        return os.path.getmtime(split_archive_path(path)[0])
+    return os.path.getmtime(path)
+
+
+def get_scene_file_fingerprint(path):
+    """Return [size, mtime_ns] of a scene file, or None when it does not exist. Archive members use their .tar."""
+    if path.startswith(VSITAR_PREFIX):
+        path = split_archive_path(path)[0]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def read_scene_json(path):
+    """Read a JSON file of a scene, extracted or straight from its archive."""
+    if path.startswith(VSITAR_PREFIX):
+        archive_path, member_name = split_archive_path(path)
+        with tarfile.open(archive_path, 'r') as tar, tar.extractfile(member_name) as member:
+            return json.load(member)
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def find_mtl_file(scene_files):
+    """Return the path of the MTL JSON among a scene's {file name: path}, or None."""
+    for file_name, file_path in sorted(scene_files.items()):
+        if 'MTL' in file_name and file_name.endswith('.json'):
+            return file_path  # Return the first matching file
+    return None
+
+
+def get_band_paths(base_path, folder_name, scene_files=None):
+    """Return the paths of the B1 to B7 and B10 band files of a scene, /vsitar/ paths when not extracted.
+
+    `scene_files` is the scene's {file name: path} when already listed, e.g. by the scene registry.
+    """
+    # Construct the full path by appending the folder name once (correct directory structure)
+    full_base_name = os.path.join(base_path, folder_name)
+    if scene_files is None:
+        scene_files = list_scene_files(base_path)
+    return {band_name: scene_files.get(f'{folder_name}{suffix}', f'{full_base_name}{suffix}')
+            for band_name, suffix in BAND_SUFFIXES.items()}
@@ -0,0 +1,132 @@
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from shapely.geometry import shape
+
+# Cached searches older than this are sent to EarthExplorer again
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    entity_id TEXT PRIMARY KEY,
+    product_id TEXT NOT NULL,
+    acquisition_date TEXT NOT NULL,
+    cloud_cover REAL,
+    footprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS searches (
+    query_key TEXT PRIMARY KEY,
+    searched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS search_results (
+    query_key TEXT NOT NULL REFERENCES searches (query_key) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    entity_id TEXT NOT NULL REFERENCES scenes (entity_id),
+    PRIMARY KEY (query_key, position)
+);
+CREATE INDEX IF NOT EXISTS scenes_by_date ON scenes (acquisition_date);
+"""
+
+
+def get_catalog_path(root_directory):
+    """Return the path of the scene catalog database of a Reflectra directory."""
+    return os.path.join(root_directory, 'scene_footprints', 'scene_catalog.sqlite')
+
+
+def open_catalog(catalog_path):
+    """Open (and create if needed) the SQLite scene catalog."""
+    os.makedirs(os.path.dirname(catalog_path), exist_ok=True)
+    connection = sqlite3.connect(catalog_path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(CATALOG_SCHEMA)
+    return connection
+
+
+def make_query_key(dataset, latitude, longitude, start_date, end_date, max_cloud_cover):
+    """Build the key identifying an EarthExplorer search."""
+    return json.dumps({
+        'dataset': dataset,
+        'latitude': round(float(latitude), 6),
+        'longitude': round(float(longitude), 6),
+        'start_date': str(start_date),
+        'end_date': str(end_date),
+        'max_cloud_cover': max_cloud_cover,
+    }, sort_keys=True)
+
+
+def store_search(connection, query_key, scenes):
+    """Store the scenes returned by a search, replacing any earlier results of the same query."""
+    with connection:
+        connection.execute("DELETE FROM searches WHERE query_key = ?", (query_key,))
+        connection.execute("INSERT INTO searches (query_key, searched_at) VALUES (?, ?)", (query_key, time.time()))
+        for position, scene in enumerate(scenes):
+            connection.execute(
+                "INSERT OR REPLACE INTO scenes (entity_id, product_id, acquisition_date, cloud_cover, footprint) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (scene['entity_id'], scene['landsat_product_id'], scene['acquisition_date'].isoformat(),
+                 scene.get('cloud_cover'), json.dumps(scene['spatial_coverage'].__geo_interface__)))
+            connection.execute("INSERT INTO search_results (query_key, position, entity_id) VALUES (?, ?, ?)",
+                               (query_key, position, scene['entity_id']))
+
+
+def get_cached_search(connection, query_key, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Return the cached scenes of a query, or None if it was never run or has expired.
+
+    Scenes have the same keys download_landsat_data uses from landsatxplore search results.
+    """
+    row = connection.execute("SELECT searched_at FROM searches WHERE query_key = ?", (query_key,)).fetchone()
+    if row is None or time.time() - row[0] > ttl_seconds:
+        return None
+
+    rows = connection.execute(
+        "SELECT s.entity_id, s.product_id, s.acquisition_date, s.cloud_cover, s.footprint "
+        "FROM search_results r JOIN scenes s ON s.entity_id = r.entity_id "
+        "WHERE r.query_key = ? ORDER BY r.position", (query_key,)).fetchall()
+
+    return [{
+        'entity_id': entity_id,
+        'landsat_product_id': product_id,
+        'acquisition_date': datetime.fromisoformat(acquisition_date),
+        'cloud_cover': cloud_cover,
+        'spatial_coverage': shape(json.loads(footprint)),
+    } for entity_id, product_id, acquisition_date, cloud_cover, footprint in rows]
+
+
+def purge_expired_searches(connection, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Delete searches older than the TTL, and scenes no search refers to anymore."""
+    with connection:
+        connection.execute("DELETE FROM searches WHERE searched_at < ?", (time.time() - ttl_seconds,))
+        connection.execute("DELETE FROM scenes WHERE entity_id NOT IN (SELECT entity_id FROM search_results)")
+
+
+def cached_search(api, catalog_path, dataset, latitude, longitude, start_date, end_date, max_cloud_cover,
+                  ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Run an EarthExplorer search through the local catalog, only calling `api.search` on a miss.
+
+    Every miss also purges the searches older than `ttl_seconds`, so the catalog does not grow forever.
+    """
+    query_key = make_query_key(dataset, latitude, longitude, start_date, end_date, max_cloud_cover)
+    connection = open_catalog(catalog_path)
+    try:
+        scenes = get_cached_search(connection, query_key, ttl_seconds)
+        if scenes is not None:
+            print(f"Using {len(scenes)} cached search results from {catalog_path}.")
+            return scenes
+
+        scenes = api.search(
+            dataset=dataset,
+            latitude=latitude,
+            longitude=longitude,
+            start_date=start_date,
+            end_date=end_date,
+            max_cloud_cover=max_cloud_cover
+        )
+        # Drop expired searches (this one included) and their orphaned scenes before storing the new results
+        purge_expired_searches(connection, ttl_seconds)
+        store_search(connection, query_key, scenes)
+        return scenes
+    finally:
+        connection.close()
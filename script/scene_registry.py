@@ -0,0 +1,51 @@
+import os
+from collections import namedtuple
+
+from scene_bands import find_mtl_file, get_band_paths, list_scene_files, list_scenes
+
+# What the pipeline stages need to know about one scene. `files` maps file names to readable paths
+# (/vsitar/ for members of a scene that was not extracted); the *_path outputs may not exist yet.
+Scene = namedtuple('Scene', ['name', 'folder_path', 'files', 'band_paths', 'mtl_path', 'stac_path', 'qa_path',
+                             'summary_path', 'values_path', 'results_folder'])
+
+# Registries already built by this process, with the raw_data modification time they were built at
+_registries = {}
+
+
+def make_scene(root_directory, folder_name, folder_path):
+    """Discover the files of one scene with a single listing of its folder and .tar."""
+    files = list_scene_files(folder_path)
+    return Scene(
+        name=folder_name,
+        folder_path=folder_path,
+        files=files,
+        band_paths=get_band_paths(folder_path, folder_name, files),
+        mtl_path=find_mtl_file(files),
+        stac_path=files.get(f"{folder_name}_SR_stac.json"),
+        qa_path=files.get(f"{folder_name}_QA_PIXEL.TIF"),
+        summary_path=os.path.join(folder_path, f"{folder_name}_SUMMARY.json"),
+        values_path=os.path.join(folder_path, f"{folder_name}_SR_ST_values.json"),
+        results_folder=os.path.join(root_directory, 'results', folder_name),
+    )
+
+
+def get_scene_registry(root_directory, refresh=False):
+    """Return {scene name: Scene} of every scene in raw_data, sorted by name.
+
+    raw_data is scanned once and the registry reused by every stage until its entries change
+    (downloads, extractions and removals update the folder's mtime). `refresh` forces a rescan.
+    Returns an empty registry when raw_data does not exist.
+    """
+    raw_data_folder = os.path.join(root_directory, 'raw_data')
+    if not os.path.isdir(raw_data_folder):
+        return {}
+
+    mtime = os.stat(raw_data_folder).st_mtime_ns
+    cached = _registries.get(raw_data_folder)
+    if cached and cached[0] == mtime and not refresh:
+        return cached[1]
+
+    registry = {folder_name: make_scene(root_directory, folder_name, folder_path)
+                for folder_name, folder_path in list_scenes(raw_data_folder).items()}
+    _registries[raw_data_folder] = (mtime, registry)
+    return registry
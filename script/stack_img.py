@@ -1,112 +1,246 @@
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
 import numpy as np
-import json
-import matplotlib.pyplot as plt  # Import matplotlib for displaying images
-
-# Function to extract bounding box from STAC JSON
-def extract_metadata(stac_file):
-    with open(stac_file, 'r') as f:
-        data = json.load(f)
 
-    # Extracting the bounding box coordinates
-    bbox = data['bbox']
-    ul_lon, ul_lat = bbox[0], bbox[3]  # Upper Left Longitude and Latitude
-    lr_lon, lr_lat = bbox[2], bbox[1]  # Lower Right Longitude and Latitude
+from instrumentation import instrumented
+from scale_factors import FILL_VALUE
+from scene_bands import get_scene_file_mtime, list_scene_files
+from scene_registry import get_scene_registry
+
+# Suffixes of the bands stacked into the Red, Green and Blue channels
+RGB_SUFFIXES = ('SR_B4.TIF', 'SR_B3.TIF', 'SR_B2.TIF')
+
+# Block size of the stacked GeoTIFF, one block of all three channels is a few MB in float32
+STACK_BLOCK_SIZE = 512
+
+# Smallest internal overview of the stacked Cloud-Optimized GeoTIFF, in pixels
+MIN_OVERVIEW_SIZE = 256
+
+
+def compute_global_max(bands):
+    """First pass: find the maximum DN across all bands, reading them block by block."""
+    global_max = 0
+    for band in bands:
+        for _, window in band.ds.block_windows(band.bidx):
+            global_max = max(global_max, int(band.ds.read(band.bidx, window=window).max()))
+    return global_max
+
+
+def compute_percentile_limits(bands, low_percentile=2, high_percentile=98, use_overviews=False):
+    """First pass: per-band histograms of the valid DNs, giving the DNs at the low and high percentiles.
+
+    Histograms are accumulated block by block, or from the coarsest overview (at least
+    MIN_OVERVIEW_SIZE pixels wide) when `use_overviews` is set and the band has internal overviews.
+    """
+    lows, highs = [], []
+    for band in bands:
+        histogram = np.zeros(65536, dtype=np.int64)
+        factors = [factor for factor in band.ds.overviews(band.bidx) if band.ds.width // factor >= MIN_OVERVIEW_SIZE]
+
+        if use_overviews and factors:
+            out_shape = (band.ds.height // factors[-1], band.ds.width // factors[-1])
+            histogram += np.bincount(band.ds.read(band.bidx, out_shape=out_shape).ravel(), minlength=65536)
+        else:
+            for _, window in band.ds.block_windows(band.bidx):
+                histogram += np.bincount(band.ds.read(band.bidx, window=window).ravel(), minlength=65536)
+
+        # Ignore fill pixels so the scene border does not drag the low limit down
+        histogram[FILL_VALUE] = 0
+        cumulative = np.cumsum(histogram)
+        lows.append(int(np.searchsorted(cumulative, cumulative[-1] * low_percentile / 100)))
+        highs.append(int(np.searchsorted(cumulative, cumulative[-1] * high_percentile / 100)))
+
+    return lows, highs
+
+
+def write_scaled_rgb(bands, output_file, lows, highs, tags=None):
+    """Second pass: scale the [low, high] range of each band to 0-255 and write it block by block.
+
+    `bands` are the Red, Green and Blue `rasterio.Band`s, which must share the same grid. `tags` are
+    stored in the output's metadata.
+    """
+    reference = bands[0].ds
+    profile = {
+        'driver': 'GTiff',
+        'height': reference.height,
+        'width': reference.width,
+        'count': 3,
+        'dtype': 'uint8',
+        'crs': reference.crs,
+        'transform': reference.transform,
+        'tiled': True,
+        'blockxsize': STACK_BLOCK_SIZE,
+        'blockysize': STACK_BLOCK_SIZE,
+    }
+
+    lows = np.asarray(lows, dtype=np.float32).reshape(3, 1, 1)
+    ranges = np.maximum(np.asarray(highs, dtype=np.float32).reshape(3, 1, 1) - lows, 1)
+
+    # Blocks go to a temporary tiled GeoTIFF first, which is then rewritten as a COG
+    temporary_file = f"{output_file}.tmp.tif"
+    try:
+        with rasterio.open(temporary_file, 'w', **profile) as dst:
+            # Iterate the output's block windows so only one block of each channel is in memory
+            for _, window in dst.block_windows(1):
+                block = np.stack([band.ds.read(band.bidx, window=window) for band in bands]).astype(np.float32)
+                block = np.clip((block - lows) / ranges, 0, 1) * 255
+                dst.write(block.astype(np.uint8), window=window)
+            dst.update_tags(**(tags or {}))
+
+        write_cloud_optimized(temporary_file, output_file)
+    except BaseException:
+        # Never leave temporary files behind in results/<scene>
+        for path in (temporary_file, f"{output_file}.cog.tmp.tif"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+
+def write_cloud_optimized(temporary_file, output_file):
+    """Add internal overviews to a tiled GeoTIFF and rewrite it as a compressed Cloud-Optimized GeoTIFF."""
+    with rasterio.open(temporary_file, 'r+') as dst:
+        factors = []
+        factor = 2
+        while max(dst.width, dst.height) // factor >= MIN_OVERVIEW_SIZE:
+            factors.append(factor)
+            factor *= 2
+        dst.build_overviews(factors, Resampling.average)
+        dst.update_tags(ns='rio_overview', resampling='average')
+
+    # Copying with the source overviews puts them ahead of the full-resolution tiles, as COG readers expect
+    cog_file = f"{output_file}.cog.tmp.tif"
+    rasterio.shutil.copy(temporary_file, cog_file, driver='GTiff', tiled=True,
+                         blockxsize=STACK_BLOCK_SIZE, blockysize=STACK_BLOCK_SIZE,
+                         compress='deflate', copy_src_overviews=True)
+    os.remove(temporary_file)
+
+    # Replace the output in one step, so an interrupted run never leaves a stack that looks up to date
+    os.replace(cog_file, output_file)
+
+
+def get_stack_tags(stretch, use_overviews):
+    """Tags recording the parameters a stacked image was built with."""
+    return {'reflectra_stretch': stretch, 'reflectra_use_overviews': str(bool(use_overviews))}
 
-    # Default CRS for WRS-2
-    crs = 'EPSG:4326'  # WGS 84
-
-    return (ul_lon, ul_lat, lr_lon, lr_lat, crs)
 
 # Function to process each folder in the raw data directory
-def run_process_data(folder_path, folder_name, root_directory):
-    stac_file = None
-    file_list = []
-
-    # Look for STAC JSON and band files in the specified folder
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith('_SR_stac.json'):
-            stac_file = os.path.join(folder_path, file_name)
-        elif file_name.endswith('SR_B4.TIF'):
-            file_list.append(os.path.join(folder_path, file_name))  # Red band
-        elif file_name.endswith('SR_B3.TIF'):
-            file_list.append(os.path.join(folder_path, file_name))  # Green band
-        elif file_name.endswith('SR_B2.TIF'):
-            file_list.append(os.path.join(folder_path, file_name))  # Blue band
-
-    if stac_file and len(file_list) == 3:  # Ensure we found the STAC file and all three bands
-        # Extract metadata
-        ul_lon, ul_lat, lr_lon, lr_lat, crs = extract_metadata(stac_file)
-
-        # Read each band and stack them into an RGB image
-        bands = {}
-        for i, path in enumerate(file_list):
-            with rasterio.open(path) as src:
-                bands[i] = src.read(1)  # Read the first band (2D array)
-
-        # Stack the bands into an RGB image
-        rgb_image = np.dstack((bands[2], bands[1], bands[0]))  # Assuming [R, G, B] order
-
-        # Normalize the values to 0-255 for visualization
-        rgb_image = (rgb_image / rgb_image.max() * 255).astype(np.uint8)
-
-        # Show the RGB image using matplotlib
-        plt.imshow(rgb_image)
-        plt.title('Stacked RGB Image')
-        plt.axis('off')  # Hide axis
-        # plt.show()  # Display the image
-
-        # Define the transform based on the bounding box
-        transform = rasterio.transform.from_bounds(ul_lon, lr_lat, lr_lon, ul_lat, rgb_image.shape[1], rgb_image.shape[0])
-
+def run_process_data(folder_path, folder_name, root_directory, stretch='max', use_overviews=False,
+                     scene_files=None):
+    """Stack the Red, Green and Blue bands of a scene into results/<scene>/stacked_img_<scene>.tif.
+
+    `stretch` is 'max' to scale all bands by the global maximum, or 'percentile' for a
+    per-band 2-98% stretch (histograms from overviews when `use_overviews` is set).
+    `scene_files` is the scene's {file name: path} from the scene registry, listed here when not given.
+    """
+    band_files = {}
+    if scene_files is None:
+        scene_files = list_scene_files(folder_path)
+
+    # Look for the band files in the specified folder, or read them straight from the scene's .tar
+    for file_name, file_path in scene_files.items():
+        for suffix in RGB_SUFFIXES:
+            if file_name.endswith(suffix):
+                band_files[suffix] = file_path
+
+    if len(band_files) == 3:  # Ensure we found all three bands
         # Create results directory if it doesn't exist
-        results_directory = os.path.join(root_directory, "results")
-        os.makedirs(results_directory, exist_ok=True)
-        output_subdirectory = os.path.join(results_directory, folder_name)
-        # print(f"output: {output_subdirectory}")
-
-        # Write the RGB image as a GeoTIFF in the new subdirectory
-        output_file = os.path.join(output_subdirectory, f"stacked_img_{folder_name}.tif")
-        with rasterio.open(
-                output_file,
-                'w',
-                driver='GTiff',
-                height=rgb_image.shape[0],
-                width=rgb_image.shape[1],
-                count=3,
-                dtype='uint8',
-                crs=crs,
-                transform=transform
-        ) as dst:
-            dst.write(rgb_image[:, :, 0], 1)  # Red channel
-            dst.write(rgb_image[:, :, 1], 2)  # Green channel
-            dst.write(rgb_image[:, :, 2], 3)  # Blue channel
+        output_file = get_stack_output_path(root_directory, folder_name)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+        # Stream the Red, Green and Blue bands into the GeoTIFF, keeping their native CRS and transform
+        red_path, green_path, blue_path = (band_files[suffix] for suffix in RGB_SUFFIXES)
+        with rasterio.open(red_path) as red, rasterio.open(green_path) as green, rasterio.open(blue_path) as blue:
+            bands = [rasterio.band(src, 1) for src in (red, green, blue)]
+
+            # Normalize the values to 0-255 for visualization
+            if stretch == 'percentile':
+                lows, highs = compute_percentile_limits(bands, use_overviews=use_overviews)
+            elif stretch == 'max':
+                lows, highs = [0, 0, 0], [compute_global_max(bands)] * 3
+            else:
+                raise ValueError(f"Unknown stretch '{stretch}', expected 'max' or 'percentile'.")
+            write_scaled_rgb(bands, output_file, lows, highs, get_stack_tags(stretch, use_overviews))
 
         return True  # Data processed successfully
     return False  # Data not processed due to missing files
 
 
-# Function to traverse and process folders in raw_data
-def stack_image(raw_data_folder):
-    # Traverse through each folder in raw_data
-    raw_data_folder = os.path.join(raw_data_folder, "raw_data")
+def get_stack_output_path(root_directory, folder_name):
+    """Return the path of a scene's stacked image in results/<scene>."""
+    return os.path.join(root_directory, "results", folder_name, f"stacked_img_{folder_name}.tif")
 
-    for folder_name in os.listdir(raw_data_folder):
-        folder_path = os.path.join(raw_data_folder, folder_name)
-        print(folder_path)
 
-        # Check if the folder is a directory
-        if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_path}")
-            extracted_data = run_process_data(folder_path, folder_name, root_directory)
+def is_stack_up_to_date(output_file, folder_path, scene_files=None, stretch='max', use_overviews=False):
+    """Check whether the stacked image exists, was built with the same parameters and is newer than all
+    of the scene's RGB bands.
+    """
+    if not os.path.exists(output_file):
+        return False
 
-            if extracted_data:
-                print(f"Data extracted successfully from {folder_name}.\n")
-            else:
-                print(f"No valid STAC JSON or bands found in {folder_name}.\n")
+    with rasterio.open(output_file) as src:
+        tags = src.tags()
+    expected_tags = get_stack_tags(stretch, use_overviews)
+    if any(tags.get(name) != value for name, value in expected_tags.items()):
+        return False
+
+    if scene_files is None:
+        scene_files = list_scene_files(folder_path)
+    band_mtimes = [get_scene_file_mtime(file_path)
+                   for file_name, file_path in scene_files.items() if file_name.endswith(RGB_SUFFIXES)]
+    return bool(band_mtimes) and os.path.getmtime(output_file) > max(band_mtimes)
+
+
+def stack_scene(folder_path, folder_name, root_directory, stretch='max', use_overviews=False, force=False,
+                scene_files=None):
+    """Stack one scene unless its output is up to date. Returns (folder_name, status, seconds)."""
+    start = time.perf_counter()
+    output_file = get_stack_output_path(root_directory, folder_name)
+    if not force and is_stack_up_to_date(output_file, folder_path, scene_files, stretch, use_overviews):
+        return folder_name, 'up to date', time.perf_counter() - start
+
+    processed = run_process_data(folder_path, folder_name, root_directory, stretch, use_overviews, scene_files)
+    return folder_name, 'stacked' if processed else 'missing files', time.perf_counter() - start
+
+
+# Function to traverse and process folders in raw_data
+@instrumented('stack')
+def stack_image(root_directory, stretch='max', use_overviews=False, max_workers=1, force=False):
+    """Stack every scene in raw_data, skipping scenes whose stacked image is newer than their bands and
+    was built with the same `stretch` and `use_overviews`.
+
+    With `max_workers` > 1 the scenes are stacked in a process pool. `force` restacks every scene.
+    """
+    # Traverse through each scene in raw_data
+    tasks = [(scene.folder_path, folder_name, root_directory, stretch, use_overviews, force, scene.files)
+             for folder_name, scene in get_scene_registry(root_directory).items()]
+
+    start = time.perf_counter()
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(stack_scene, *zip(*tasks))) if tasks else []
+    else:
+        results = [stack_scene(*task) for task in tasks]
+
+    for folder_name, status, seconds in results:
+        if status == 'stacked':
+            print(f"Data extracted successfully from {folder_name} in {seconds:.2f} s.")
+        elif status == 'up to date':
+            print(f"Stacked image of {folder_name} is up to date, skipped.")
+        else:
+            print(f"Red, Green or Blue band (SR_B4/B3/B2) missing in {folder_name}.")
+
+    stacked = sum(status == 'stacked' for _, status, _ in results)
+    print(f"Stacked {stacked} of {len(results)} scenes in {time.perf_counter() - start:.2f} s.\n")
+    return results
 
 # Main execution
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-stack_image(root_directory)
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    stack_image(root_directory)
+
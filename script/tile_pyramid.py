@@ -0,0 +1,151 @@
+import functools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.enums import Resampling
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+
+TILE_SIZE = 256
+
+# Half the width of the Web-Mercator (EPSG:3857) world, in metres
+WEB_MERCATOR_ORIGIN = math.pi * 6378137.0
+
+
+def get_tile_bounds(z, x, y):
+    """Return the (left, bottom, right, top) Web-Mercator bounds of an XYZ tile."""
+    tile_span = 2 * WEB_MERCATOR_ORIGIN / 2 ** z
+    left = -WEB_MERCATOR_ORIGIN + x * tile_span
+    top = WEB_MERCATOR_ORIGIN - y * tile_span
+    return left, top - tile_span, left + tile_span, top
+
+
+def get_tile_range(bounds, z):
+    """Return the (x_min, x_max, y_min, y_max) XYZ tile indices covering Web-Mercator bounds at zoom z."""
+    left, bottom, right, top = bounds
+    tile_span = 2 * WEB_MERCATOR_ORIGIN / 2 ** z
+    last_tile = 2 ** z - 1
+
+    def clip(index):
+        return min(max(int(index), 0), last_tile)
+
+    return (clip((left + WEB_MERCATOR_ORIGIN) // tile_span), clip((right + WEB_MERCATOR_ORIGIN) // tile_span),
+            clip((WEB_MERCATOR_ORIGIN - top) // tile_span), clip((WEB_MERCATOR_ORIGIN - bottom) // tile_span))
+
+
+def get_zoom_range(tif_file_path):
+    """Return the Web-Mercator bounds of an image, the zoom where it fits in one tile and its native zoom."""
+    with rasterio.open(tif_file_path) as src:
+        bounds = transform_bounds(src.crs, 'EPSG:3857', *src.bounds)
+        width = src.width
+
+    left, bottom, right, top = bounds
+    extent = max(right - left, top - bottom)
+    resolution = (right - left) / width
+    min_zoom = max(0, int(math.floor(math.log2(2 * WEB_MERCATOR_ORIGIN / extent))))
+    max_zoom = max(min_zoom, int(math.ceil(math.log2(2 * WEB_MERCATOR_ORIGIN / (TILE_SIZE * resolution)))))
+    return bounds, min_zoom, max_zoom
+
+
+@functools.lru_cache(maxsize=16)
+def open_source(tif_file_path, overview_level=None):
+    """Keep the source image, or one of its overviews, open for all the tiles a worker process renders."""
+    if overview_level is None:
+        return rasterio.open(tif_file_path)
+    return rasterio.open(tif_file_path, overview_level=overview_level)
+
+
+@functools.lru_cache(maxsize=64)
+def get_overview_level(tif_file_path, z):
+    """Return the coarsest overview level still at least as fine as a zoom-z tile, or None for full resolution.
+
+    The warper reads whichever dataset it is given at that dataset's resolution, so low zooms must be
+    rendered from an overview to avoid decoding the whole image for every tile.
+    """
+    src = open_source(tif_file_path)
+    left, _, right, _ = transform_bounds(src.crs, 'EPSG:3857', *src.bounds)
+    source_resolution = (right - left) / src.width
+    tile_resolution = 2 * WEB_MERCATOR_ORIGIN / 2 ** z / TILE_SIZE
+
+    overview_level = None
+    for level, factor in enumerate(src.overviews(1)):  # Finest overview first
+        if source_resolution * factor <= tile_resolution:
+            overview_level = level
+    return overview_level
+
+
+def render_tile(tif_file_path, tiles_directory, z, x, y, image_format='png'):
+    """Warp one 256px tile of the image to Web-Mercator and save it as {z}/{x}/{y}.<format>.
+
+    Only the source blocks under the tile are read, from the overview matching the zoom. Returns False
+    for tiles with no data.
+    """
+    src = open_source(tif_file_path, get_overview_level(tif_file_path, z))
+    left, bottom, right, top = get_tile_bounds(z, x, y)
+
+    with WarpedVRT(src, crs='EPSG:3857', transform=from_bounds(left, bottom, right, top, TILE_SIZE, TILE_SIZE),
+                   width=TILE_SIZE, height=TILE_SIZE, nodata=0, resampling=Resampling.bilinear) as vrt:
+        rgb = vrt.read([1, 2, 3])
+
+    # Fully black pixels are fill or outside the scene, so they are made transparent
+    alpha = np.where(rgb.any(axis=0), 255, 0).astype(np.uint8)
+    if not alpha.any():
+        return False
+
+    tile_path = os.path.join(tiles_directory, str(z), str(x), f"{y}.{image_format}")
+    os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+    Image.fromarray(np.dstack([*rgb, alpha]), "RGBA").save(tile_path)
+    return True
+
+
+def generate_tile_pyramid(tif_file_path, tiles_directory, min_zoom=None, max_zoom=None, image_format='png',
+                          max_workers=None):
+    """Turn a stacked image into an on-disk XYZ tile pyramid, rendering tiles in a process pool.
+
+    The zoom range defaults to the zoom where the scene fits in one tile up to its native resolution.
+    Returns the number of tiles written.
+    """
+    bounds, default_min_zoom, default_max_zoom = get_zoom_range(tif_file_path)
+    min_zoom = default_min_zoom if min_zoom is None else min_zoom
+    max_zoom = default_max_zoom if max_zoom is None else max_zoom
+
+    tiles = []
+    for z in range(min_zoom, max_zoom + 1):
+        x_min, x_max, y_min, y_max = get_tile_range(bounds, z)
+        tiles += [(z, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+
+    if not tiles:
+        return 0
+
+    z_values, x_values, y_values = zip(*tiles)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        written = executor.map(render_tile, [tif_file_path] * len(tiles), [tiles_directory] * len(tiles),
+                               z_values, x_values, y_values, [image_format] * len(tiles),
+                               chunksize=max(1, len(tiles) // 64))
+        return sum(written)
+
+
+def generate_tile_pyramids(root_directory, min_zoom=None, max_zoom=None, image_format='png', max_workers=None):
+    """Generate a tile pyramid in results/<scene>/tiles for every stacked image in results."""
+    results_directory = os.path.join(root_directory, 'results')
+
+    if not os.path.exists(results_directory):
+        print(f"The specified folder '{results_directory}' does not exist.")
+        return
+
+    for folder_name in os.listdir(results_directory):
+        tif_file_path = os.path.join(results_directory, folder_name, f"stacked_img_{folder_name}.tif")
+
+        if os.path.exists(tif_file_path):
+            print(f"Processing folder: {folder_name}")
+            start = time.perf_counter()
+            tiles_directory = os.path.join(results_directory, folder_name, 'tiles')
+            count = generate_tile_pyramid(tif_file_path, tiles_directory, min_zoom, max_zoom, image_format,
+                                          max_workers)
+            print(f"{count} tiles written to {tiles_directory} in {time.perf_counter() - start:.2f} s.\n")
@@ -1,9 +1,10 @@
 import os
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import json
 
+from instrumentation import instrumented
+from scene_registry import get_scene_registry
+
 def visualize_data(json_file_path, root_directory, results_folder):
     """Visualizes the data from the given JSON file."""
     # Read the JSON file
@@ -49,7 +50,10 @@ def visualize_data(json_file_path, root_directory, results_folder):
         'Surface Reflectance': sr_values
     })
 
-    # Plotting
+    # Plotting, matplotlib and seaborn are imported here so importing this module stays fast
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     plt.figure(figsize=(10, 6))
     sns.lineplot(data=df, x=[(low + high) / 2 for low, high in wavelengths], y='Surface Reflectance',
                  marker='o')
@@ -91,6 +95,7 @@ def visualize_data(json_file_path, root_directory, results_folder):
     plt.savefig(plot_filename, format='jpg', dpi=300, bbox_inches='tight')
     plt.close()  # Close the plot to avoid displaying it during batch processing
 
+@instrumented('visualise-sr-st')
 def run_data_visualisation_sr_st(root_directory):
     """Processes all folders within the specified root folder, extracting data from MTL JSON files."""
     # Construct the full path to the raw_data folder
@@ -106,35 +111,26 @@ def run_data_visualisation_sr_st(root_directory):
         print(f"Contents of the parent directory: {os.listdir(os.path.dirname(raw_data_folder))}")
         return
 
-    # Traverse through each folder in raw_data
-    for folder_name in os.listdir(raw_data_folder):
-        folder_path = os.path.join(raw_data_folder, folder_name)
-
-        # Check if the folder is a directory
-        if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_path}")
-
-            # Construct the JSON file path
-            json_file_name = f"{folder_name}_SR_ST_values.json"
-            json_file_path = os.path.join(folder_path, json_file_name)
-
-            # Check if the JSON file exists
-            if not os.path.exists(json_file_path):
-                print(f"Warning: JSON file '{json_file_name}' does not exist in '{folder_path}'.")
-                continue
+    # Traverse through each scene in raw_data
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        print(f"Processing folder: {scene.folder_path}")
 
-            # Define the results directory based on the current folder name
-            results_folder = os.path.join(root_directory, 'results', folder_name)
+        # Check if the SR/ST values JSON file exists
+        json_file_path = scene.values_path
+        if not os.path.exists(json_file_path):
+            print(f"Warning: JSON file '{os.path.basename(json_file_path)}' does not exist in '{scene.folder_path}'.")
+            continue
 
-            # Create the results directory if it doesn't exist
-            os.makedirs(results_folder, exist_ok=True)
+        # Create the results directory of the scene if it doesn't exist
+        os.makedirs(scene.results_folder, exist_ok=True)
 
-            # Visualize the data from the JSON file
-            visualize_data(json_file_path, root_directory, results_folder)
+        # Visualize the data from the JSON file
+        visualize_data(json_file_path, root_directory, scene.results_folder)
 
-            print(f"Visualization completed for {folder_name}.\n")
+        print(f"Visualization completed for {folder_name}.\n")
 
 # Execute the script
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-run_data_visualisation_sr_st(root_directory)
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    run_data_visualisation_sr_st(root_directory)
@@ -1,7 +1,9 @@
 import os
 import pandas as pd
 import json
-import matplotlib.pyplot as plt
+
+from instrumentation import instrumented
+from scene_registry import get_scene_registry
 
 
 def display_summary_data(json_file_path, results_folder):
@@ -56,7 +58,9 @@ def display_summary_data(json_file_path, results_folder):
         print("No attributes found in the JSON file.")
         return
 
-    # Plot the tables
+    # Plot the tables, matplotlib is imported here so importing this module stays fast
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(8, 10))
 
     # Display Image Attributes Table
@@ -91,6 +95,7 @@ def display_summary_data(json_file_path, results_folder):
     plt.close()  # Close the plot to avoid displaying it during batch processing
 
 
+@instrumented('visualise-summary')
 def run_data_visualisation_summary(root_directory):
     """Processes all folders within the specified root folder, extracting data from SUMMARY JSON files."""
     # Construct the full path to the raw_data folder
@@ -101,33 +106,24 @@ def run_data_visualisation_summary(root_directory):
         print(f"The specified folder '{raw_data_folder}' does not exist.")
         return
 
-    # Traverse through each folder in raw_data
-    for folder_name in os.listdir(raw_data_folder):
-        folder_path = os.path.join(raw_data_folder, folder_name)
-
-        # Check if the folder is a directory
-        if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_path}")
-
-            # Construct the JSON file path
-            json_file_name = f"{folder_name}_SUMMARY.json"
-            json_file_path = os.path.join(folder_path, json_file_name)
-
-            # Check if the JSON file exists
-            if not os.path.exists(json_file_path):
-                print(f"Warning: JSON file '{json_file_name}' does not exist in '{folder_path}'.")
-                continue
+    # Traverse through each scene in raw_data
+    for folder_name, scene in get_scene_registry(root_directory).items():
+        print(f"Processing folder: {scene.folder_path}")
 
-            # Define the results directory based on the current folder name
-            results_folder = os.path.join(root_directory, 'results', folder_name)
+        # Check if the SUMMARY JSON file exists
+        json_file_path = scene.summary_path
+        if not os.path.exists(json_file_path):
+            print(f"Warning: JSON file '{os.path.basename(json_file_path)}' does not exist in '{scene.folder_path}'.")
+            continue
 
-            # Create the results directory if it doesn't exist
-            os.makedirs(results_folder, exist_ok=True)
+        # Create the results directory of the scene if it doesn't exist
+        os.makedirs(scene.results_folder, exist_ok=True)
 
-            # Display the summary data from the JSON file
-            display_summary_data(json_file_path, results_folder)
+        # Display the summary data from the JSON file
+        display_summary_data(json_file_path, scene.results_folder)
 
 
-current_directory = os.getcwd()  # Get the current working directory
-root_directory = os.path.dirname(current_directory)  # Move up one directory
-run_data_visualisation_summary(root_directory)
+if __name__ == "__main__":
+    current_directory = os.getcwd()  # Get the current working directory
+    root_directory = os.path.dirname(current_directory)  # Move up one directory
+    run_data_visualisation_summary(root_directory)
@@ -1,8 +1,16 @@
+import os
+import sys
 import streamlit as st
 import pandas as pd
 import requests
 from datetime import datetime
 
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "script"))
+
+from footprint_index import scenes_covering_point, update_footprint_index
+from scene_catalog import get_cached_search, get_catalog_path, make_query_key, open_catalog
+
 google_api_key = ""
 observer_lat = 0
 observer_lon = 0
@@ -57,6 +65,15 @@ if location_choice == "Enter Coordinates" or (location_choice == "Enter Address"
     location_data = pd.DataFrame({'lat': [observer_lat], 'lon': [observer_lon]})
     st.map(location_data)
 
+    # Downloaded scenes covering the location, from the footprint spatial index
+    footprints_directory = os.path.join(os.path.dirname(os.getcwd()), "landsatTest", "scene_footprints")
+    if os.path.isdir(footprints_directory):
+        covering_scenes = scenes_covering_point(update_footprint_index(footprints_directory),
+                                                observer_lat, observer_lon)
+        st.write(f"Downloaded scenes covering this location: {len(covering_scenes)}")
+        for product_id in covering_scenes:
+            st.write(f"- {product_id}")
+
 # Add a section for date selection and cloud coverage
 st.write("### Select Date Range and Cloud Coverage")
 
@@ -80,4 +97,26 @@ cloud_coverage = st.slider("Cloud Coverage (%)", min_value=0, max_value=100, val
 st.write(f"Selected Cloud Coverage: {cloud_coverage}%")
 
 if st.button("Get Data"):
-    st.write("Fetching data for the selected location and parameters...")
\ No newline at end of file
+    st.write("Fetching data for the selected location and parameters...")
+
+    # Serve repeated searches from the local scene catalog instead of querying EarthExplorer
+    if date_choice == "Specify Dates":
+        search_start, search_end = str(start_date), str(end_date)
+    else:
+        search_start, search_end = '2024-01-01', datetime.today().strftime('%Y-%m-%d')
+
+    root_directory = os.path.join(os.path.dirname(os.getcwd()), "landsatTest")
+    connection = open_catalog(get_catalog_path(root_directory))
+    scenes = get_cached_search(connection, make_query_key('landsat_ot_c2_l2', observer_lat, observer_lon,
+                                                          search_start, search_end, cloud_coverage))
+    connection.close()
+
+    if scenes is None:
+        st.info("This search has not been run yet, it will be sent to EarthExplorer when downloading.")
+    else:
+        st.write(f"### {len(scenes)} Scenes Found (cached)")
+        st.dataframe(pd.DataFrame({
+            "Product ID": [scene['landsat_product_id'] for scene in scenes],
+            "Acquisition Date": [scene['acquisition_date'].strftime('%Y-%m-%d') for scene in scenes],
+            "Cloud Cover (%)": [scene['cloud_cover'] for scene in scenes],
+        }))
\ No newline at end of file
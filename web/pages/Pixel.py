@@ -3,10 +3,19 @@ import numpy as np
 import zipfile
 import io
 import os
+import sys
 import pandas as pd  # For creating the CSV
+import rasterio
+from rasterio.windows import Window
 from PIL import Image, ImageDraw
 from streamlit_drawable_canvas import st_canvas
 
+# Make the pipeline modules in script/ importable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "script"))
+
+from band_cube import open_band_cube, read_cube_values
+from pixel_resolver import is_inside, latlon_to_rowcol, rowcol_to_latlon
+
 
 def find_csv_in_directory(directory):
     csv_file_path = None
@@ -52,6 +61,28 @@ def extract_3x3_rgb_grid(img_array, center_x, center_y):
     return grid
 
 
+def load_preview(tif_file_path, max_display_width):
+    """Read the stacked image at display size, letting GDAL use the matching internal overview."""
+    with rasterio.open(tif_file_path) as src:
+        original_width, original_height = src.width, src.height
+        display_ratio = min(max_display_width / original_width, 0.5)
+        display_width = int(original_width * display_ratio)
+        display_height = int(original_height * display_ratio)
+        preview = src.read([1, 2, 3], out_shape=(3, display_height, display_width))
+
+    img = Image.fromarray(np.moveaxis(preview, 0, -1), "RGB")
+    return img, original_width, original_height, display_width, display_height
+
+
+def read_3x3_rgb_grid(tif_file_path, center_x, center_y):
+    """Read only the 3x3 window around (center_x, center_y) at full resolution."""
+    with rasterio.open(tif_file_path) as src:
+        window = Window(center_x - 1, center_y - 1, 3, 3)
+        pixels = src.read([1, 2, 3], window=window, boundless=True, fill_value=0)
+
+    return extract_3x3_rgb_grid(np.moveaxis(pixels, 0, -1), 1, 1)
+
+
 def get_scaled_pixel():
     # Retrieve scaled_x and scaled_y from session state
     scaled_x = st.session_state.get("scaled_x", None)  # Use None as a default value if not set
@@ -116,6 +147,7 @@ def run_streamlit(root_directory):
     st.title("Reflectra DataBoard")
 
     results_dir = os.path.join(root_directory, "landsatTest/results")
+    raw_data_dir = os.path.join(root_directory, "landsatTest/raw_data")
     tif_file_path = None
 
     for folder_name in os.listdir(results_dir):
@@ -139,14 +171,9 @@ def run_streamlit(root_directory):
             else:
                 st.success(f"File '{tif_file_path}' found!")
 
-    img = Image.open(tif_file_path)
-    original_width, original_height = img.size
-    img = img.convert("RGB")
-
     max_display_width = 600
-    display_ratio = min(max_display_width / original_width, 0.5)
-    display_width = int(original_width * display_ratio)
-    display_height = int(original_height * display_ratio)
+    img, original_width, original_height, display_width, display_height = load_preview(tif_file_path,
+                                                                                        max_display_width)
 
     # Initialize session state for storing all points
     if "points" not in st.session_state:
@@ -180,8 +207,6 @@ def run_streamlit(root_directory):
         key="canvas",
     )
 
-    img_array = np.array(img)
-
     # Check if there is any click registered and store the most recent point
     if canvas_result.json_data is not None and len(canvas_result.json_data["objects"]) > 0:
         obj = canvas_result.json_data["objects"][-1]
@@ -195,6 +220,23 @@ def run_streamlit(root_directory):
         new_point = (scaled_x, scaled_y, orig_x, orig_y)
         if new_point not in st.session_state["points"]:
             st.session_state["points"].append(new_point)
+
+    # Locate a pixel from a ground location using the stacked image's native georeference
+    with st.expander("Locate by latitude and longitude"):
+        latitude = st.number_input("Latitude", format="%.6f", value=0.0, key="locate_lat")
+        longitude = st.number_input("Longitude", format="%.6f", value=0.0, key="locate_lon")
+        if st.button("Locate pixel"):
+            rows, cols = latlon_to_rowcol(tif_file_path, [latitude], [longitude])
+            if is_inside(tif_file_path, rows, cols)[0]:
+                orig_x, orig_y = int(cols[0]), int(rows[0])
+                scaled_x = int(orig_x / original_width * display_width)
+                scaled_y = int(orig_y / original_height * display_height)
+                new_point = (scaled_x, scaled_y, orig_x, orig_y)
+                if new_point not in st.session_state["points"]:
+                    st.session_state["points"].append(new_point)
+            else:
+                st.warning("This location is outside the scene.")
+
     image_path_1, image_path_2 = find_images(results_dir)
     # Display the 3x3 grid and selected pixel information side by side
     if st.session_state["points"]:
@@ -208,8 +250,10 @@ def run_streamlit(root_directory):
                 st.write(f"### Selected Pixel Information:")
                 st.write(f"**Scaled Coordinates** (Canvas Size): X = {scaled_x}, Y = {scaled_y}")
                 st.write(f"**Original Coordinates** (Image Size): X = {orig_x}, Y = {orig_y}")
+                lats, lons = rowcol_to_latlon(tif_file_path, [orig_y], [orig_x])
+                st.write(f"**Location**: Latitude = {lats[0]:.6f}, Longitude = {lons[0]:.6f}")
 
-                rgb_grid = extract_3x3_rgb_grid(img_array, orig_x, orig_y)
+                rgb_grid = read_3x3_rgb_grid(tif_file_path, orig_x, orig_y)
                 st.write("### 3x3 RGB Grid Around the Selected Pixel:")
 
                 # Display the RGB values as a table
@@ -221,6 +265,17 @@ def run_streamlit(root_directory):
                 grid_img = draw_3x3_grid_image(rgb_grid)
                 st.image(grid_img, caption="3x3 RGB Grid Map Around the Target Pixel", use_column_width=True)
 
+            # Show SR/ST at the selected pixel straight from the scene's memory-mapped band cube
+            scene_name = os.path.basename(os.path.dirname(tif_file_path))
+            cube = open_band_cube(os.path.join(raw_data_dir, scene_name), scene_name)
+            if cube is not None:
+                values = read_cube_values(cube, orig_x, orig_y)
+                st.write("### Surface Reflectance and Surface Temperature at the Selected Pixel")
+                st.table(pd.DataFrame({
+                    "Band": list(values),
+                    "Value": [f"{value:.2f} K" if band == "B10" else f"{value:.4f}" for band, value in values.items()]
+                }))
+
             # Display SR graph and summary data
 
 